@@ -1,22 +1,31 @@
-from telegram.ext import ApplicationBuilder
-from handlers import register_handlers  # Импорт функции регистрации обработчиков
-from database import create_tables      # Импорт функции создания таблиц в базе данных
 from dotenv import load_dotenv
 import os
 
-# Загрузка переменных окружения из файла .env
+# Загрузка переменных окружения из файла .env (до импорта обработчиков — они читают STATE_FILE)
 load_dotenv()
 
+from telegram.ext import ApplicationBuilder, PersistenceInput, PicklePersistence
+from handlers import register_handlers  # Импорт функции регистрации обработчиков
+from database import create_tables      # Импорт функции создания таблиц в базе данных
+
 # Получение токена из переменной окружения
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Файл для сохранения состояния диалогов между перезапусками (необязательно)
+STATE_FILE = os.getenv("STATE_FILE")
 
 if __name__ == '__main__':
     # Создание таблиц в базе данных
     create_tables()
-    
+
     # Инициализация бота
-    app = ApplicationBuilder().token(BOT_TOKEN).read_timeout(30).connect_timeout(30).build()
-    
+    builder = ApplicationBuilder().token(BOT_TOKEN).read_timeout(30).connect_timeout(30)
+    if STATE_FILE:
+        # bot_data не сохраняем: планировщик напоминаний пересобирает его после запуска
+        builder = builder.persistence(
+            PicklePersistence(filepath=STATE_FILE, store_data=PersistenceInput(bot_data=False))
+        )
+    app = builder.build()
+
     # Регистрация всех обработчиков
     register_handlers(app)
 
@@ -1,29 +1,115 @@
 import asyncio
 import json
+import logging
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+
+logger = logging.getLogger(__name__)
 
 DB_PATH = Path(__file__).with_name("menu.db")
+T = TypeVar("T")
+STATEMENT_CACHE_SIZE = 512
+SCHEMA_VERSION = 6
+NOW_SQL = "STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+CONNECTION_PRAGMAS = """
+PRAGMA synchronous = NORMAL;
+PRAGMA temp_store = MEMORY;
+PRAGMA mmap_size = 268435456;
+PRAGMA cache_size = -65536;
+PRAGMA busy_timeout = 5000;
+PRAGMA foreign_keys = ON;
+"""
+
+
+def _unicode_lower(value: Optional[str]) -> Optional[str]:
+    return value.lower() if isinstance(value, str) else value
 
 
 def get_db_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        isolation_level=None,
+    )
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+    conn.create_function("unicode_lower", 1, _unicode_lower, deterministic=True)
+    conn.executescript(CONNECTION_PRAGMAS)
     return conn
 
 
-def _ensure_column(conn: sqlite3.Connection, table: str, column: str, ddl: str) -> None:
-    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
-    if column not in existing:
-        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+POOL_SIZE = 8
+_POOL: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=POOL_SIZE)
+_WRITE_LOCK = threading.Lock()
+_writer: Optional[sqlite3.Connection] = None
+
+
+@contextmanager
+def borrow_conn() -> Iterator[sqlite3.Connection]:
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+@contextmanager
+def _write_conn() -> Iterator[sqlite3.Connection]:
+    global _writer
+    with _WRITE_LOCK:
+        if _writer is None:
+            _writer = get_db_connection()
+        _writer.execute("BEGIN IMMEDIATE")
+        try:
+            yield _writer
+            _writer.commit()
+        except BaseException:
+            if _writer.in_transaction:
+                _writer.rollback()
+            raise
+
+
+DISH_MIGRATION_COLUMNS: List[Tuple[str, str]] = [
+    ("description", "TEXT"),
+    ("instructions", "TEXT"),
+    ("category", "TEXT"),
+    ("cuisine", "TEXT"),
+    ("servings", "INTEGER DEFAULT 1"),
+    ("prep_time", "INTEGER DEFAULT 0"),
+    ("cook_time", "INTEGER DEFAULT 0"),
+    ("difficulty", "TEXT"),
+    ("is_favorite", "INTEGER DEFAULT 0"),
+    ("created_at", "TEXT"),
+    ("updated_at", "TEXT"),
+    ("source", "TEXT"),
+    ("notes", "TEXT"),
+]
 
 
 def create_tables() -> None:
     conn = get_db_connection()
+    conn.execute("PRAGMA journal_mode = WAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return
     cursor = conn.cursor()
+    cursor.execute("BEGIN")
 
     cursor.execute(
         """
@@ -36,25 +122,19 @@ def create_tables() -> None:
         """
     )
 
-    _ensure_column(conn, "dishes", "description", "TEXT")
-    _ensure_column(conn, "dishes", "instructions", "TEXT")
-    _ensure_column(conn, "dishes", "category", "TEXT")
-    _ensure_column(conn, "dishes", "cuisine", "TEXT")
-    _ensure_column(conn, "dishes", "servings", "INTEGER DEFAULT 1")
-    _ensure_column(conn, "dishes", "prep_time", "INTEGER DEFAULT 0")
-    _ensure_column(conn, "dishes", "cook_time", "INTEGER DEFAULT 0")
-    _ensure_column(conn, "dishes", "difficulty", "TEXT")
-    _ensure_column(conn, "dishes", "is_favorite", "INTEGER DEFAULT 0")
-    _ensure_column(conn, "dishes", "created_at", "TEXT DEFAULT CURRENT_TIMESTAMP")
-    _ensure_column(conn, "dishes", "updated_at", "TEXT DEFAULT CURRENT_TIMESTAMP")
-    _ensure_column(conn, "dishes", "source", "TEXT")
-    _ensure_column(conn, "dishes", "notes", "TEXT")
+    for column, ddl in DISH_MIGRATION_COLUMNS:
+        try:
+            cursor.execute(f"ALTER TABLE dishes ADD COLUMN {column} {ddl}")
+        except sqlite3.OperationalError as exc:
+            if "duplicate column" not in str(exc):
+                raise
 
     cursor.execute(
         """
-        CREATE UNIQUE INDEX IF NOT EXISTS idx_dishes_name ON dishes(LOWER(name))
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_dishes_name_nocase ON dishes(name COLLATE NOCASE)
         """
     )
+    cursor.execute("DROP INDEX IF EXISTS idx_dishes_name")
 
     cursor.execute(
         """
@@ -113,12 +193,18 @@ def create_tables() -> None:
             remind_at TEXT NOT NULL,
             message TEXT NOT NULL,
             job_name TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY(dish_id) REFERENCES dishes(id) ON DELETE SET NULL,
             FOREIGN KEY(plan_id) REFERENCES meal_plans(id) ON DELETE CASCADE
         )
         """
     )
+    try:
+        cursor.execute("ALTER TABLE reminders ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError as exc:
+        if "duplicate column" not in str(exc):
+            raise
 
     cursor.execute(
         """
@@ -147,9 +233,10 @@ def create_tables() -> None:
         """
     )
 
+    cursor.execute("DROP INDEX IF EXISTS idx_meal_plans_user_date")
     cursor.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_meal_plans_user_date ON meal_plans(user_id, plan_date)
+        CREATE INDEX IF NOT EXISTS idx_meal_plans_user_date_type ON meal_plans(user_id, plan_date, meal_type)
         """
     )
     cursor.execute(
@@ -157,6 +244,26 @@ def create_tables() -> None:
         CREATE INDEX IF NOT EXISTS idx_reminders_user_time ON reminders(user_id, remind_at)
         """
     )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_reminders_job ON reminders(job_name)
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_reminders_time ON reminders(remind_at)
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_actions_user_time ON user_actions(user_id, created_at DESC)
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_dish_tags_tag ON dish_tags(tag)
+        """
+    )
 
     cursor.execute(
         """
@@ -164,198 +271,369 @@ def create_tables() -> None:
         """
     )
 
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
+    conn.execute("ANALYZE")
     conn.close()
 
 
-async def _run_in_thread(func, *args, **kwargs):
-    return await asyncio.to_thread(func, *args, **kwargs)
+_READ_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sqlite-r")
+_WRITE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-w")
+
 
+async def _run_read(func: Callable[[], T]) -> T:
+    return await asyncio.get_running_loop().run_in_executor(_READ_EXECUTOR, func)
 
-def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
-    return {key: row[key] for key in row.keys()}
+
+async def _run_write(func: Callable[[], T]) -> T:
+    return await asyncio.get_running_loop().run_in_executor(_WRITE_EXECUTOR, func)
+
+
+def close_database() -> None:
+    global _writer
+    _WRITE_EXECUTOR.shutdown(wait=True)
+    _READ_EXECUTOR.shutdown(wait=True)
+    with _WRITE_LOCK:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+    while True:
+        try:
+            _POOL.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+DISH_CACHE_SIZE = 512
+DASHBOARD_CACHE_TTL = 5.0
+LIST_CACHE_TTL = 10.0
+NAME_INDEX_TTL = 30.0
+_DISH_CACHE: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+_DASHBOARD_CACHE: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_LIST_CACHE: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+_NAME_INDEX: Optional[Tuple[float, Dict[str, int], List[Tuple[int, str]]]] = None
+_NAME_INDEX_GENERATION = 0
+_DISH_CACHE_GENERATION = 0
+_LIST_CACHE_GENERATION = 0
+_CACHE_LOCK = threading.Lock()
+
+
+def _cache_dish(dish_id: int, data: Dict[str, Any], generation: Optional[int] = None) -> None:
+    with _CACHE_LOCK:
+        if generation is not None and generation != _DISH_CACHE_GENERATION:
+            return
+        _DISH_CACHE[dish_id] = data
+        _DISH_CACHE.move_to_end(dish_id)
+        while len(_DISH_CACHE) > DISH_CACHE_SIZE:
+            _DISH_CACHE.popitem(last=False)
+
+
+def _cached_dish(dish_id: int) -> Optional[Dict[str, Any]]:
+    with _CACHE_LOCK:
+        data = _DISH_CACHE.get(dish_id)
+        if data is not None:
+            _DISH_CACHE.move_to_end(dish_id)
+        return data
+
+
+def _drop_list_cache() -> None:
+    global _LIST_CACHE_GENERATION
+    _LIST_CACHE.clear()
+    _LIST_CACHE_GENERATION += 1
+
+
+def _drop_name_index() -> None:
+    global _NAME_INDEX, _NAME_INDEX_GENERATION
+    _NAME_INDEX = None
+    _NAME_INDEX_GENERATION += 1
+
+
+def invalidate_dish(dish_id: int) -> None:
+    global _DISH_CACHE_GENERATION
+    with _CACHE_LOCK:
+        _DISH_CACHE.pop(dish_id, None)
+        _DISH_CACHE_GENERATION += 1
+        _drop_list_cache()
+        _DASHBOARD_CACHE.clear()
+        _drop_name_index()
+
+
+def invalidate_dish_lists() -> None:
+    with _CACHE_LOCK:
+        _drop_list_cache()
+        _DASHBOARD_CACHE.clear()
+        _drop_name_index()
+
+
+def invalidate_dashboard() -> None:
+    with _CACHE_LOCK:
+        _DASHBOARD_CACHE.clear()
+
+
+DISH_COLUMNS_SQL = (
+    "id, name, description, recipe, instructions, category, cuisine, servings, prep_time, cook_time, "
+    "difficulty, is_favorite, source, notes, created_at, updated_at"
+)
+SELECT_DISH_BY_ID_SQL = f"SELECT {DISH_COLUMNS_SQL} FROM dishes WHERE id = ?"
+SELECT_DISH_TAGS_SQL = "SELECT tag FROM dish_tags WHERE dish_id = ? ORDER BY tag"
+SELECT_DISH_INGREDIENTS_SQL = (
+    "SELECT name, quantity, unit, calories, protein, fat, carbs FROM dish_ingredients WHERE dish_id = ? ORDER BY name"
+)
+SELECT_PENDING_REMINDERS_SQL = (
+    "SELECT id, user_id, chat_id, dish_id, plan_id, remind_at, message, job_name, attempts FROM reminders"
+)
+INSERT_DISH_SQL = """
+    INSERT INTO dishes (
+        name, description, recipe, instructions, category, cuisine,
+        servings, prep_time, cook_time, difficulty, is_favorite, source, notes,
+        created_at, updated_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {now}, {now})
+""".format(now=NOW_SQL)
+INSERT_INGREDIENT_SQL = """
+    INSERT INTO dish_ingredients (
+        dish_id, name, quantity, unit, calories, protein, fat, carbs
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+INSERT_TAG_SQL = "INSERT OR IGNORE INTO dish_tags (dish_id, tag) VALUES (?, ?)"
+DISH_EXISTS_SQL = "SELECT id FROM dishes WHERE id = ?"
+DELETE_DISH_TAGS_SQL = "DELETE FROM dish_tags WHERE dish_id = ?"
+DELETE_DISH_INGREDIENTS_SQL = "DELETE FROM dish_ingredients WHERE dish_id = ?"
+RETURNING_ID_SQL = " RETURNING id" if sqlite3.sqlite_version_info >= (3, 35, 0) else ""
+
+
+def _inserted_id(cursor: sqlite3.Cursor) -> int:
+    if RETURNING_ID_SQL:
+        return cursor.fetchone()[0]
+    return cursor.lastrowid
+
+
+def _ingredient_rows(dish_id: int, ingredients: Iterable[Dict[str, Any]]) -> List[Tuple[Any, ...]]:
+    return [
+        (
+            dish_id,
+            ingredient.get("name"),
+            ingredient.get("quantity"),
+            ingredient.get("unit"),
+            ingredient.get("calories"),
+            ingredient.get("protein"),
+            ingredient.get("fat"),
+            ingredient.get("carbs"),
+        )
+        for ingredient in ingredients
+        if ingredient.get("name")
+    ]
+
+
+def _tag_rows(dish_id: int, tags: Iterable[str]) -> List[Tuple[int, str]]:
+    return [(dish_id, tag) for tag in dict.fromkeys(tag.strip().lower() for tag in tags) if tag]
+
+
+ORDER_COLUMNS = {
+    "name": "name",
+    "category": "category",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
 
 
 async def list_dishes(order_by: str = "name") -> List[Dict[str, Any]]:
-    def _list() -> List[Dict[str, Any]]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT * FROM dishes ORDER BY {order_by} COLLATE NOCASE")
-        rows = cursor.fetchall()
-        conn.close()
-        dishes: List[Dict[str, Any]] = []
-        for row in rows:
-            data = _row_to_dict(row)
-            data["tags"] = [tag_row[0] for tag_row in cursor.execute("SELECT tag FROM dish_tags WHERE dish_id = ? ORDER BY tag", (row["id"],)).fetchall()]
-            data["ingredients_list"] = [
-                _row_to_dict(ing)
-                for ing in cursor.execute(
-                    "SELECT name, quantity, unit, calories, protein, fat, carbs FROM dish_ingredients WHERE dish_id = ? ORDER BY name",
-                    (row["id"],),
-                ).fetchall()
-            ]
-            dishes.append(data)
-        return dishes
+    column = ORDER_COLUMNS.get(order_by, "name")
 
-    return await _run_in_thread(_list)
+    def _list() -> List[Dict[str, Any]]:
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {DISH_COLUMNS_SQL} FROM dishes ORDER BY {column} COLLATE NOCASE")
+            dishes_by_id: Dict[int, Dict[str, Any]] = {}
+            for row in cursor.fetchall():
+                data = dict(row)
+                data["tags"] = []
+                data["ingredients_list"] = []
+                dishes_by_id[data["id"]] = data
+            for tag_row in cursor.execute("SELECT dish_id, tag FROM dish_tags ORDER BY tag").fetchall():
+                dish = dishes_by_id.get(tag_row["dish_id"])
+                if dish is not None:
+                    dish["tags"].append(tag_row["tag"])
+            cursor.execute(
+                "SELECT dish_id, name, quantity, unit, calories, protein, fat, carbs FROM dish_ingredients ORDER BY name"
+            )
+            columns = [column[0] for column in cursor.description[1:]]
+            while True:
+                batch = cursor.fetchmany(500)
+                if not batch:
+                    break
+                for ing in batch:
+                    dish = dishes_by_id.get(ing[0])
+                    if dish is not None:
+                        dish["ingredients_list"].append(dict(zip(columns, tuple(ing)[1:])))
+            return list(dishes_by_id.values())
+
+    now = time.monotonic()
+    with _CACHE_LOCK:
+        cached = _LIST_CACHE.get(column)
+        generation = _LIST_CACHE_GENERATION
+    if cached is not None and cached[0] > now:
+        return [dict(dish) for dish in cached[1]]
+
+    dishes = await _run_read(_list)
+    with _CACHE_LOCK:
+        if generation == _LIST_CACHE_GENERATION:
+            _LIST_CACHE[column] = (now + LIST_CACHE_TTL, dishes)
+    return [dict(dish) for dish in dishes]
+
+
+def _load_dish(conn: sqlite3.Connection, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    if not row:
+        return None
+    data = dict(row)
+    data["tags"] = [tag_row[0] for tag_row in conn.execute(SELECT_DISH_TAGS_SQL, (row["id"],)).fetchall()]
+    data["ingredients_list"] = [
+        dict(ing) for ing in conn.execute(SELECT_DISH_INGREDIENTS_SQL, (row["id"],)).fetchall()
+    ]
+    return data
 
 
 async def get_dish_by_id(dish_id: int) -> Optional[Dict[str, Any]]:
+    cached = _cached_dish(dish_id)
+    if cached is not None:
+        return dict(cached)
+    with _CACHE_LOCK:
+        generation = _DISH_CACHE_GENERATION
+
     def _get() -> Optional[Dict[str, Any]]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM dishes WHERE id = ?", (dish_id,))
-        row = cursor.fetchone()
-        if not row:
-            conn.close()
-            return None
-        data = _row_to_dict(row)
-        data["tags"] = [tag_row[0] for tag_row in cursor.execute("SELECT tag FROM dish_tags WHERE dish_id = ? ORDER BY tag", (dish_id,)).fetchall()]
-        data["ingredients_list"] = [
-            _row_to_dict(ing)
-            for ing in cursor.execute(
-                "SELECT name, quantity, unit, calories, protein, fat, carbs FROM dish_ingredients WHERE dish_id = ? ORDER BY name",
-                (dish_id,),
-            ).fetchall()
-        ]
-        conn.close()
-        return data
+        with borrow_conn() as conn:
+            return _load_dish(conn, conn.execute(SELECT_DISH_BY_ID_SQL, (dish_id,)).fetchone())
 
-    return await _run_in_thread(_get)
+    data = await _run_read(_get)
+    if data is None:
+        return None
+    _cache_dish(dish_id, data, generation)
+    return dict(data)
+
+
+async def _dish_name_index() -> Tuple[Dict[str, int], List[Tuple[int, str]]]:
+    global _NAME_INDEX
+    now = time.monotonic()
+    with _CACHE_LOCK:
+        index = _NAME_INDEX
+        generation = _NAME_INDEX_GENERATION
+    if index is not None and index[0] > now:
+        return index[1], index[2]
+
+    def _build() -> Tuple[Dict[str, int], List[Tuple[int, str]]]:
+        with borrow_conn() as conn:
+            names = [(row[0], row[1]) for row in conn.execute("SELECT id, name FROM dishes ORDER BY name")]
+        by_name: Dict[str, int] = {}
+        for dish_id, name in names:
+            by_name.setdefault(name.lower(), dish_id)
+        return by_name, names
+
+    by_name, names = await _run_read(_build)
+    with _CACHE_LOCK:
+        if generation == _NAME_INDEX_GENERATION:
+            _NAME_INDEX = (now + NAME_INDEX_TTL, by_name, names)
+    return by_name, names
 
 
 async def get_dish_by_name(name: str) -> Optional[Dict[str, Any]]:
-    def _get() -> Optional[Dict[str, Any]]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM dishes WHERE LOWER(name) = LOWER(?)", (name.strip(),))
-        row = cursor.fetchone()
-        conn.close()
-        if not row:
-            return None
-        return row["id"]
-
-    dish_id = await _run_in_thread(_get)
+    by_name, _ = await _dish_name_index()
+    dish_id = by_name.get(name.strip().lower())
     if dish_id is None:
         return None
     return await get_dish_by_id(dish_id)
 
-async def search_dish_names(query: str, limit: int = 5) -> List[Dict[str, Any]]:
-    pattern = f"%{query.strip().lower()}%"
-
-    def _search() -> List[Dict[str, Any]]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, name FROM dishes WHERE LOWER(name) LIKE ? ORDER BY name LIMIT ?",
-            (pattern, limit),
-        )
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
 
-    return await _run_in_thread(_search)
+async def search_dish_names(query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    needle = query.strip().lower()
+    _, names = await _dish_name_index()
+    matches: List[Dict[str, Any]] = []
+    for dish_id, name in names:
+        if needle in name.lower():
+            matches.append({"id": dish_id, "name": name})
+            if len(matches) >= limit:
+                break
+    return matches
 
 
 async def add_dish(
     dish_data: Dict[str, Any],
     ingredients: Sequence[Dict[str, Any]],
     tags: Sequence[str],
-) -> int:
+    return_row: bool = False,
+) -> Union[int, Dict[str, Any]]:
     name = dish_data.get("name", "").strip()
     if not name:
         raise ValueError("Название блюда не может быть пустым")
 
-    def _insert() -> int:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM dishes WHERE LOWER(name) = LOWER(?)", (name,))
-        if cursor.fetchone():
-            conn.close()
-            raise ValueError("Блюдо с таким названием уже существует")
-
-        now = datetime.utcnow().isoformat()
-        servings = dish_data.get("servings") or 1
-        aggregated_ingredients = "; ".join(
-            f"{ing.get('name')} {ing.get('quantity', '')}{ing.get('unit', '')}".strip()
-            for ing in ingredients
-            if ing.get("name")
-        )
-        instructions = dish_data.get("instructions") or dish_data.get("recipe") or ""
-        cursor.execute(
-            """
-            INSERT INTO dishes (
-                name, description, ingredients, recipe, instructions, category, cuisine,
-                servings, prep_time, cook_time, difficulty, is_favorite, source, notes,
-                created_at, updated_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                name,
-                dish_data.get("description"),
-                aggregated_ingredients,
-                instructions,
-                instructions,
-                dish_data.get("category"),
-                dish_data.get("cuisine"),
-                servings,
-                dish_data.get("prep_time") or 0,
-                dish_data.get("cook_time") or 0,
-                dish_data.get("difficulty"),
-                1 if dish_data.get("is_favorite") else 0,
-                dish_data.get("source"),
-                dish_data.get("notes"),
-                now,
-                now,
-            ),
-        )
-        dish_id = cursor.lastrowid
+    def _insert() -> Tuple[int, Optional[Dict[str, Any]]]:
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM dishes WHERE name = ? COLLATE NOCASE", (name,))
+            if cursor.fetchone():
+                raise ValueError("Блюдо с таким названием уже существует")
 
-        for ingredient in ingredients:
-            if not ingredient.get("name"):
-                continue
+            servings = dish_data.get("servings") or 1
+            instructions = dish_data.get("instructions") or dish_data.get("recipe") or ""
             cursor.execute(
-                """
-                INSERT INTO dish_ingredients (
-                    dish_id, name, quantity, unit, calories, protein, fat, carbs
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
+                INSERT_DISH_SQL + RETURNING_ID_SQL,
                 (
-                    dish_id,
-                    ingredient.get("name"),
-                    ingredient.get("quantity"),
-                    ingredient.get("unit"),
-                    ingredient.get("calories"),
-                    ingredient.get("protein"),
-                    ingredient.get("fat"),
-                    ingredient.get("carbs"),
+                    name,
+                    dish_data.get("description"),
+                    instructions,
+                    instructions,
+                    dish_data.get("category"),
+                    dish_data.get("cuisine"),
+                    servings,
+                    dish_data.get("prep_time") or 0,
+                    dish_data.get("cook_time") or 0,
+                    dish_data.get("difficulty"),
+                    1 if dish_data.get("is_favorite") else 0,
+                    dish_data.get("source"),
+                    dish_data.get("notes"),
                 ),
             )
+            dish_id = _inserted_id(cursor)
 
-        for tag in tags:
-            clean_tag = tag.strip().lower()
-            if clean_tag:
-                cursor.execute(
-                    "INSERT OR IGNORE INTO dish_tags (dish_id, tag) VALUES (?, ?)",
-                    (dish_id, clean_tag),
-                )
+            cursor.executemany(INSERT_INGREDIENT_SQL, _ingredient_rows(dish_id, ingredients))
+            cursor.executemany(INSERT_TAG_SQL, _tag_rows(dish_id, tags))
+            return dish_id, _reload_dish(conn, dish_id) if return_row else None
 
-        conn.commit()
-        conn.close()
+    dish_id, data = await _run_write(_insert)
+    invalidate_dish_lists()
+    if not return_row:
         return dish_id
+    _cache_dish(dish_id, data)
+    return dict(data)
+
+
+DishWriteResult = Union[bool, Optional[Dict[str, Any]]]
 
-    return await _run_in_thread(_insert)
 
+def _reload_dish(conn: sqlite3.Connection, dish_id: int) -> Optional[Dict[str, Any]]:
+    return _load_dish(conn, conn.execute(SELECT_DISH_BY_ID_SQL, (dish_id,)).fetchone())
 
-async def update_dish(dish_id: int, updates: Dict[str, Any]) -> bool:
+
+def _finish_dish_write(
+    dish_id: int,
+    ok: bool,
+    data: Optional[Dict[str, Any]],
+    return_row: bool,
+) -> DishWriteResult:
+    invalidate_dish(dish_id)
+    if data is not None:
+        _cache_dish(dish_id, data)
+    if return_row:
+        return dict(data) if data is not None else None
+    return ok
+
+
+async def update_dish(dish_id: int, updates: Dict[str, Any], return_row: bool = False) -> DishWriteResult:
     if not updates:
-        return False
+        return await get_dish_by_id(dish_id) if return_row else False
 
     valid_fields = {
         "name",
         "description",
-        "ingredients",
         "recipe",
         "instructions",
         "category",
@@ -378,37 +656,35 @@ async def update_dish(dish_id: int, updates: Dict[str, Any]) -> bool:
         values.append(value)
 
     if not sets:
-        return False
+        return await get_dish_by_id(dish_id) if return_row else False
 
-    values.append(datetime.utcnow().isoformat())
     values.append(dish_id)
 
-    def _update() -> bool:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            f"UPDATE dishes SET {', '.join(sets)}, updated_at = ? WHERE id = ?",
-            values,
-        )
-        affected = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return affected
+    def _update() -> Tuple[bool, Optional[Dict[str, Any]]]:
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"UPDATE dishes SET {', '.join(sets)}, updated_at = {NOW_SQL} WHERE id = ?",
+                values,
+            )
+            affected = cursor.rowcount > 0
+            return affected, _reload_dish(conn, dish_id) if affected and return_row else None
 
-    return await _run_in_thread(_update)
+    affected, data = await _run_write(_update)
+    return _finish_dish_write(dish_id, affected, data, return_row)
 
 
 async def delete_dish(dish_id: int) -> bool:
     def _delete() -> bool:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM dishes WHERE id = ?", (dish_id,))
-        affected = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return affected
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM dishes WHERE id = ?", (dish_id,))
+            affected = cursor.rowcount > 0
+            return affected
 
-    return await _run_in_thread(_delete)
+    affected = await _run_write(_delete)
+    invalidate_dish(dish_id)
+    return affected
 
 
 async def replace_dish_details(
@@ -417,116 +693,86 @@ async def replace_dish_details(
     instructions: Optional[str] = None,
     tags: Optional[Sequence[str]] = None,
     description: Optional[str] = None,
-) -> bool:
-    def _replace() -> bool:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM dishes WHERE id = ?", (dish_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return False
+    return_row: bool = False,
+) -> DishWriteResult:
+    def _replace() -> Tuple[bool, Optional[Dict[str, Any]]]:
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(DISH_EXISTS_SQL, (dish_id,))
+            if not cursor.fetchone():
+                return False, None
+
+            cursor.execute(DELETE_DISH_INGREDIENTS_SQL, (dish_id,))
+            cursor.executemany(INSERT_INGREDIENT_SQL, _ingredient_rows(dish_id, ingredients))
+
+            if tags is not None:
+                cursor.execute(DELETE_DISH_TAGS_SQL, (dish_id,))
+                cursor.executemany(INSERT_TAG_SQL, _tag_rows(dish_id, tags))
+
+            updates: Dict[str, Any] = {"ingredients": None}
+            if instructions is not None:
+                updates["recipe"] = instructions
+                updates["instructions"] = instructions
+            if description is not None:
+                updates["description"] = description
+
+            set_parts = [f"{key} = ?" for key in updates]
+            values = list(updates.values())
+            values.append(dish_id)
 
-        cursor.execute("DELETE FROM dish_ingredients WHERE dish_id = ?", (dish_id,))
-        aggregated_ingredients = []
-        for ingredient in ingredients:
-            if not ingredient.get("name"):
-                continue
             cursor.execute(
-                """
-                INSERT INTO dish_ingredients (
-                    dish_id, name, quantity, unit, calories, protein, fat, carbs
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    dish_id,
-                    ingredient.get("name"),
-                    ingredient.get("quantity"),
-                    ingredient.get("unit"),
-                    ingredient.get("calories"),
-                    ingredient.get("protein"),
-                    ingredient.get("fat"),
-                    ingredient.get("carbs"),
-                ),
-            )
-            aggregated_ingredients.append(
-                f"{ingredient.get('name')} {ingredient.get('quantity', '')}{ingredient.get('unit', '')}".strip()
+                f"UPDATE dishes SET {', '.join(set_parts)}, updated_at = {NOW_SQL} WHERE id = ?",
+                values,
             )
+            return True, _reload_dish(conn, dish_id) if return_row else None
+
+    replaced, data = await _run_write(_replace)
+    return _finish_dish_write(dish_id, replaced, data, return_row)
 
-        if tags is not None:
-            cursor.execute("DELETE FROM dish_tags WHERE dish_id = ?", (dish_id,))
-            for tag in tags:
-                clean_tag = tag.strip().lower()
-                if clean_tag:
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO dish_tags (dish_id, tag) VALUES (?, ?)",
-                        (dish_id, clean_tag),
-                    )
-
-        updates = {"ingredients": "; ".join(aggregated_ingredients)}
-        if instructions is not None:
-            updates["recipe"] = instructions
-            updates["instructions"] = instructions
-        if description is not None:
-            updates["description"] = description
-
-        set_parts = [f"{key} = ?" for key in updates]
-        values = list(updates.values())
-        values.append(datetime.utcnow().isoformat())
-        values.append(dish_id)
-
-        cursor.execute(
-            f"UPDATE dishes SET {', '.join(set_parts)}, updated_at = ? WHERE id = ?",
-            values,
-        )
-        conn.commit()
-        conn.close()
-        return True
 
-    return await _run_in_thread(_replace)
+async def toggle_favorite(dish_id: int, value: bool, return_row: bool = False) -> DishWriteResult:
+    return await update_dish(dish_id, {"is_favorite": 1 if value else 0}, return_row=return_row)
 
-async def toggle_favorite(dish_id: int, value: bool) -> bool:
-    return await update_dish(dish_id, {"is_favorite": 1 if value else 0})
 
+async def list_dish_summaries(favorites_only: bool = False) -> List[Dict[str, Any]]:
+    where = "WHERE is_favorite = 1 " if favorites_only else ""
 
-async def list_favorites() -> List[Dict[str, Any]]:
     def _list() -> List[Dict[str, Any]]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM dishes WHERE is_favorite = 1 ORDER BY name")
-        ids = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return ids
+        with borrow_conn() as conn:
+            rows = conn.execute(f"SELECT id, name FROM dishes {where}ORDER BY name COLLATE NOCASE").fetchall()
+            return [dict(row) for row in rows]
 
-    dish_ids = await _run_in_thread(_list)
-    favorites: List[Dict[str, Any]] = []
-    for dish_id in dish_ids:
-        dish = await get_dish_by_id(dish_id)
-        if dish:
-            favorites.append(dish)
-    return favorites
+    return await _run_read(_list)
 
 
 async def get_dashboard_summary(user_id: str) -> Dict[str, Any]:
     def _summary() -> Dict[str, Any]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM dishes")
-        total_dishes = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM dishes WHERE is_favorite = 1")
-        favorite_count = cursor.fetchone()[0]
-        cursor.execute(
-            "SELECT COUNT(*) FROM meal_plans WHERE user_id = ? AND plan_date >= date('now')",
-            (user_id,),
-        )
-        upcoming = cursor.fetchone()[0]
-        conn.close()
-        return {
-            "total_dishes": total_dishes,
-            "favorite_count": favorite_count,
-            "upcoming": upcoming,
-        }
-
-    return await _run_in_thread(_summary)
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM dishes")
+            total_dishes = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM dishes WHERE is_favorite = 1")
+            favorite_count = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT COUNT(*) FROM meal_plans WHERE user_id = ? AND plan_date >= date('now')",
+                (user_id,),
+            )
+            upcoming = cursor.fetchone()[0]
+            return {
+                "total_dishes": total_dishes,
+                "favorite_count": favorite_count,
+                "upcoming": upcoming,
+            }
+
+    now = time.monotonic()
+    with _CACHE_LOCK:
+        cached = _DASHBOARD_CACHE.get(user_id)
+    if cached is not None and cached[0] > now:
+        return dict(cached[1])
+    summary = await _run_read(_summary)
+    with _CACHE_LOCK:
+        _DASHBOARD_CACHE[user_id] = (now + DASHBOARD_CACHE_TTL, summary)
+    return dict(summary)
 
 
 async def create_meal_plan(
@@ -539,21 +785,22 @@ async def create_meal_plan(
     notes: Optional[str] = None,
 ) -> int:
     def _create() -> int:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO meal_plans (user_id, chat_id, dish_id, plan_date, meal_type, servings, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (user_id, chat_id, dish_id, plan_date, meal_type, servings, notes),
-        )
-        plan_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return plan_id
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO meal_plans (user_id, chat_id, dish_id, plan_date, meal_type, servings, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """
+                + RETURNING_ID_SQL,
+                (user_id, chat_id, dish_id, plan_date, meal_type, servings, notes),
+            )
+            plan_id = _inserted_id(cursor)
+            return plan_id
 
-    return await _run_in_thread(_create)
+    plan_id = await _run_write(_create)
+    invalidate_dashboard()
+    return plan_id
 
 
 async def get_meal_plans_in_range(
@@ -562,79 +809,135 @@ async def get_meal_plans_in_range(
     end_date: str,
 ) -> List[Dict[str, Any]]:
     def _fetch() -> List[Dict[str, Any]]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT mp.id, mp.plan_date, mp.meal_type, mp.servings, mp.notes,
-                   d.id as dish_id, d.name, d.category, d.cuisine, d.servings as base_servings
-            FROM meal_plans mp
-            JOIN dishes d ON d.id = mp.dish_id
-            WHERE mp.user_id = ? AND mp.plan_date BETWEEN ? AND ?
-            ORDER BY mp.plan_date, mp.meal_type
-            """,
-            (user_id, start_date, end_date),
-        )
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT mp.id, mp.plan_date, mp.meal_type, mp.servings, mp.notes,
+                       d.id as dish_id, d.name, d.category, d.cuisine, d.servings as base_servings
+                FROM meal_plans mp
+                JOIN dishes d ON d.id = mp.dish_id
+                WHERE mp.user_id = ? AND mp.plan_date BETWEEN ? AND ?
+                ORDER BY mp.plan_date, mp.meal_type
+                """,
+                (user_id, start_date, end_date),
+            )
+            rows = cursor.fetchall()
+            return [dict(row) for row in rows]
 
-    return await _run_in_thread(_fetch)
+    return await _run_read(_fetch)
 
 
 async def delete_meal_plan(plan_id: int, user_id: str) -> bool:
     def _delete() -> bool:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "DELETE FROM meal_plans WHERE id = ? AND user_id = ?",
-            (plan_id, user_id),
-        )
-        affected = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return affected
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM meal_plans WHERE id = ? AND user_id = ?",
+                (plan_id, user_id),
+            )
+            affected = cursor.rowcount > 0
+            return affected
+
+    affected = await _run_write(_delete)
+    invalidate_dashboard()
+    return affected
 
-    return await _run_in_thread(_delete)
 
+INSERT_ACTIONS_SQL = """
+    INSERT INTO user_actions (user_id, dish_id, action, payload, created_at)
+    VALUES (?, (SELECT id FROM dishes WHERE id = ?), ?, ?, ?)
+"""
+ACTION_BATCH_SIZE = 100
+_ACTION_QUEUE: "asyncio.Queue[Optional[Tuple[str, Optional[int], str, Optional[str], str]]]" = asyncio.Queue()
+_action_task: Optional["asyncio.Task[None]"] = None
 
-async def log_action(user_id: str, dish_id: Optional[int], action: str, payload: Optional[Dict[str, Any]] = None) -> None:
+
+def queue_action(user_id: str, dish_id: Optional[int], action: str, payload: Optional[Dict[str, Any]] = None) -> None:
     payload_json = json.dumps(payload, ensure_ascii=False) if payload else None
+    created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    _ACTION_QUEUE.put_nowait((user_id, dish_id, action, payload_json, created_at))
+
 
+async def log_actions_bulk(rows: Sequence[Tuple[str, Optional[int], str, Optional[str], str]]) -> None:
     def _log() -> None:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO user_actions (user_id, dish_id, action, payload) VALUES (?, ?, ?, ?)",
-            (user_id, dish_id, action, payload_json),
-        )
-        conn.commit()
-        conn.close()
+        with _write_conn() as conn:
+            conn.executemany(INSERT_ACTIONS_SQL, rows)
+
+    await _run_write(_log)
 
-    await _run_in_thread(_log)
+
+def _drain_actions(batch: List[Tuple[str, Optional[int], str, Optional[str], str]], limit: int) -> bool:
+    while len(batch) < limit:
+        try:
+            item = _ACTION_QUEUE.get_nowait()
+        except asyncio.QueueEmpty:
+            return False
+        if item is None:
+            return True
+        batch.append(item)
+    return False
+
+
+async def _write_actions(batch: List[Tuple[str, Optional[int], str, Optional[str], str]]) -> None:
+    try:
+        await log_actions_bulk(batch)
+    except Exception:
+        logger.exception("Не удалось сохранить %d действий пользователей", len(batch))
+
+
+async def _action_worker() -> None:
+    while True:
+        item = await _ACTION_QUEUE.get()
+        if item is None:
+            return
+        batch = [item]
+        stopping = _drain_actions(batch, ACTION_BATCH_SIZE)
+        await _write_actions(batch)
+        if stopping:
+            return
+
+
+def start_action_logger() -> None:
+    global _action_task
+    if _action_task is None:
+        _action_task = asyncio.get_running_loop().create_task(_action_worker())
+
+
+async def stop_action_logger() -> None:
+    global _action_task
+    if _action_task is not None:
+        _ACTION_QUEUE.put_nowait(None)
+        await _action_task
+        _action_task = None
+    while True:
+        batch: List[Tuple[str, Optional[int], str, Optional[str], str]] = []
+        _drain_actions(batch, ACTION_BATCH_SIZE)
+        if not batch:
+            break
+        await _write_actions(batch)
 
 
 async def get_recent_actions(user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
     def _fetch() -> List[Dict[str, Any]]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT action, payload, created_at FROM user_actions WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
-            (user_id, limit),
-        )
-        rows = cursor.fetchall()
-        conn.close()
-        results: List[Dict[str, Any]] = []
-        for row in rows:
-            payload = json.loads(row["payload"]) if row["payload"] else None
-            results.append({
-                "action": row["action"],
-                "payload": payload,
-                "created_at": row["created_at"],
-            })
-        return results
-
-    return await _run_in_thread(_fetch)
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT action, payload, created_at FROM user_actions WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit),
+            )
+            rows = cursor.fetchall()
+            results: List[Dict[str, Any]] = []
+            for row in rows:
+                payload = json.loads(row["payload"]) if row["payload"] else None
+                results.append({
+                    "action": row["action"],
+                    "payload": payload,
+                    "created_at": row["created_at"],
+                })
+            return results
+
+    return await _run_read(_fetch)
 
 async def get_shopping_list(
     user_id: str,
@@ -642,75 +945,64 @@ async def get_shopping_list(
     end_date: str,
 ) -> Dict[str, Any]:
     def _calculate() -> Dict[str, Any]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT mp.id as plan_id, mp.plan_date, mp.meal_type, mp.servings as planned_servings,
-                   d.id as dish_id, d.name as dish_name, d.servings as base_servings,
-                   di.name as ingredient_name, di.quantity, di.unit,
-                   di.calories, di.protein, di.fat, di.carbs
-            FROM meal_plans mp
-            JOIN dishes d ON d.id = mp.dish_id
-            LEFT JOIN dish_ingredients di ON di.dish_id = d.id
-            WHERE mp.user_id = ? AND mp.plan_date BETWEEN ? AND ?
-            ORDER BY mp.plan_date, d.name
-            """,
-            (user_id, start_date, end_date),
-        )
-        rows = cursor.fetchall()
-
-        aggregated: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
-        plans: Dict[int, Dict[str, Any]] = {}
-        for row in rows:
-            plan_id = row["plan_id"]
-            if plan_id not in plans:
-                plans[plan_id] = {
-                    "plan_id": plan_id,
-                    "plan_date": row["plan_date"],
-                    "meal_type": row["meal_type"],
-                    "dish_id": row["dish_id"],
-                    "dish_name": row["dish_name"],
-                    "planned_servings": row["planned_servings"],
-                    "base_servings": row["base_servings"],
-                }
-            ingredient_name = (row["ingredient_name"] or "").strip()
-            if not ingredient_name:
-                continue
-            base_servings = row["base_servings"] or 1
-            ratio = (row["planned_servings"] or 1) / base_servings
-            quantity = (row["quantity"] or 0) * ratio
-            key = (ingredient_name.lower(), row["unit"])
-            entry = aggregated.setdefault(
-                key,
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT mp.id as plan_id, mp.plan_date, mp.meal_type, mp.servings as planned_servings,
+                       d.id as dish_id, d.name as dish_name, d.servings as base_servings
+                FROM meal_plans mp
+                JOIN dishes d ON d.id = mp.dish_id
+                WHERE mp.user_id = ? AND mp.plan_date BETWEEN ? AND ?
+                ORDER BY mp.plan_date, d.name
+                """,
+                (user_id, start_date, end_date),
+            )
+            plans = [dict(row) for row in cursor.fetchall()]
+            cursor.execute(
+                """
+                WITH planned AS (
+                    SELECT unicode_lower(TRIM(di.name)) AS key,
+                           TRIM(di.name) AS name,
+                           di.unit,
+                           di.quantity, di.calories, di.protein, di.fat, di.carbs,
+                           1.0 * COALESCE(NULLIF(mp.servings, 0), 1) / COALESCE(NULLIF(d.servings, 0), 1) AS ratio
+                    FROM meal_plans mp
+                    JOIN dishes d ON d.id = mp.dish_id
+                    JOIN dish_ingredients di ON di.dish_id = d.id
+                    WHERE mp.user_id = ? AND mp.plan_date BETWEEN ? AND ?
+                      AND TRIM(COALESCE(di.name, '')) != ''
+                )
+                SELECT key, unit, MIN(name) AS name,
+                       SUM(COALESCE(quantity, 0) * ratio) AS quantity,
+                       SUM(COALESCE(calories, 0) * ratio) AS calories,
+                       SUM(COALESCE(protein, 0) * ratio) AS protein,
+                       SUM(COALESCE(fat, 0) * ratio) AS fat,
+                       SUM(COALESCE(carbs, 0) * ratio) AS carbs
+                FROM planned
+                GROUP BY key, unit
+                ORDER BY key
+                """,
+                (user_id, start_date, end_date),
+            )
+            items = [
                 {
-                    "name": ingredient_name,
+                    "name": row["name"],
                     "unit": row["unit"],
-                    "quantity": 0.0,
-                    "calories": 0.0,
-                    "protein": 0.0,
-                    "fat": 0.0,
-                    "carbs": 0.0,
-                },
-            )
-            entry["quantity"] += quantity
-            if row["calories"] is not None:
-                entry["calories"] += (row["calories"] or 0) * ratio
-            if row["protein"] is not None:
-                entry["protein"] += (row["protein"] or 0) * ratio
-            if row["fat"] is not None:
-                entry["fat"] += (row["fat"] or 0) * ratio
-            if row["carbs"] is not None:
-                entry["carbs"] += (row["carbs"] or 0) * ratio
-
-        conn.close()
-        items = sorted(aggregated.values(), key=lambda item: item["name"].lower())
-        return {
-            "items": items,
-            "plans": list(plans.values()),
-        }
+                    "quantity": row["quantity"],
+                    "calories": row["calories"],
+                    "protein": row["protein"],
+                    "fat": row["fat"],
+                    "carbs": row["carbs"],
+                }
+                for row in cursor.fetchall()
+            ]
+            return {
+                "items": items,
+                "plans": plans,
+            }
 
-    return await _run_in_thread(_calculate)
+    return await _run_read(_calculate)
 
 
 async def add_reminder(
@@ -721,119 +1013,128 @@ async def add_reminder(
     job_name: str,
     dish_id: Optional[int] = None,
     plan_id: Optional[int] = None,
+    attempts: int = 0,
 ) -> int:
     def _insert() -> int:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO reminders (user_id, chat_id, dish_id, plan_id, remind_at, message, job_name)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (user_id, chat_id, dish_id, plan_id, remind_at, message, job_name),
-        )
-        reminder_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return reminder_id
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO reminders (user_id, chat_id, dish_id, plan_id, remind_at, message, job_name, attempts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """
+                + RETURNING_ID_SQL,
+                (user_id, chat_id, dish_id, plan_id, remind_at, message, job_name, attempts),
+            )
+            reminder_id = _inserted_id(cursor)
+            return reminder_id
 
-    return await _run_in_thread(_insert)
+    return await _run_write(_insert)
 
 
-async def get_pending_reminders() -> List[Dict[str, Any]]:
+async def get_pending_reminders(until: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
     def _fetch() -> List[Dict[str, Any]]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, user_id, chat_id, dish_id, plan_id, remind_at, message, job_name FROM reminders"
-        )
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
-
-    return await _run_in_thread(_fetch)
+        sql = SELECT_PENDING_REMINDERS_SQL
+        params: List[Any] = []
+        if until is not None:
+            sql += " WHERE remind_at <= ?"
+            params.append(until)
+        sql += " ORDER BY remind_at"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with borrow_conn() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            return [dict(row) for row in rows]
+
+    return await _run_read(_fetch)
 
 
 async def remove_reminder(reminder_id: int) -> None:
     def _remove() -> None:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
-        conn.commit()
-        conn.close()
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+
+    await _run_write(_remove)
 
-    await _run_in_thread(_remove)
+
+async def claim_reminder(reminder_id: int) -> bool:
+    def _claim() -> bool:
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+            return cursor.rowcount > 0
+
+    return await _run_write(_claim)
 
 
 async def remove_reminder_by_job(job_name: str) -> None:
     def _remove() -> None:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM reminders WHERE job_name = ?", (job_name,))
-        conn.commit()
-        conn.close()
-
-    await _run_in_thread(_remove)
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM reminders WHERE job_name = ?", (job_name,))
+
+    await _run_write(_remove)
+
+
+USER_STATISTICS_SQL = """
+    SELECT 'total' AS kind, NULL AS label, COUNT(*) AS cnt FROM dishes
+    UNION ALL
+    SELECT 'favorite', NULL, COUNT(*) FROM dishes WHERE is_favorite = 1
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'category', category, COUNT(*) AS cnt
+        FROM dishes
+        WHERE category IS NOT NULL AND category != ''
+        GROUP BY category
+        ORDER BY cnt DESC
+        LIMIT 5
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'planned', d.name, COUNT(*) AS cnt
+        FROM meal_plans mp
+        JOIN dishes d ON d.id = mp.dish_id
+        WHERE mp.user_id = ?
+        GROUP BY mp.dish_id
+        ORDER BY cnt DESC
+        LIMIT 5
+    )
+    UNION ALL
+    SELECT 'action', action, COUNT(*) FROM user_actions WHERE user_id = ? GROUP BY action
+"""
 
 
 async def get_user_statistics(user_id: str) -> Dict[str, Any]:
     def _stats() -> Dict[str, Any]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT COUNT(*) FROM dishes")
-        total_dishes = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM dishes WHERE is_favorite = 1")
-        favorite_dishes = cursor.fetchone()[0]
-
-        cursor.execute(
-            """
-            SELECT category, COUNT(*) as cnt
-            FROM dishes
-            WHERE category IS NOT NULL AND category != ''
-            GROUP BY category
-            ORDER BY cnt DESC
-            LIMIT 5
-            """
-        )
-        top_categories = [{"category": row["category"], "count": row["cnt"]} for row in cursor.fetchall()]
-
-        cursor.execute(
-            """
-            SELECT d.name, COUNT(*) AS times
-            FROM meal_plans mp
-            JOIN dishes d ON d.id = mp.dish_id
-            WHERE mp.user_id = ?
-            GROUP BY mp.dish_id
-            ORDER BY times DESC
-            LIMIT 5
-            """,
-            (user_id,),
-        )
-        top_planned = [{"name": row["name"], "count": row["times"]} for row in cursor.fetchall()]
-
-        cursor.execute(
-            """
-            SELECT action, COUNT(*) AS cnt
-            FROM user_actions
-            WHERE user_id = ?
-            GROUP BY action
-            """,
-            (user_id,),
-        )
-        activity = {row["action"]: row["cnt"] for row in cursor.fetchall()}
-
-        conn.close()
-        return {
-            "total_dishes": total_dishes,
-            "favorite_dishes": favorite_dishes,
-            "top_categories": top_categories,
-            "top_planned": top_planned,
-            "activity": activity,
+        with borrow_conn() as conn:
+            rows = conn.execute(USER_STATISTICS_SQL, (user_id, user_id)).fetchall()
+
+        stats: Dict[str, Any] = {
+            "total_dishes": 0,
+            "favorite_dishes": 0,
+            "top_categories": [],
+            "top_planned": [],
+            "activity": {},
         }
-
-    return await _run_in_thread(_stats)
+        for row in rows:
+            kind = row["kind"]
+            if kind == "total":
+                stats["total_dishes"] = row["cnt"]
+            elif kind == "favorite":
+                stats["favorite_dishes"] = row["cnt"]
+            elif kind == "category":
+                stats["top_categories"].append({"category": row["label"], "count": row["cnt"]})
+            elif kind == "planned":
+                stats["top_planned"].append({"name": row["label"], "count": row["cnt"]})
+            elif kind == "action":
+                stats["activity"][row["label"]] = row["cnt"]
+        stats["top_categories"].sort(key=lambda item: item["count"], reverse=True)
+        stats["top_planned"].sort(key=lambda item: item["count"], reverse=True)
+        return stats
+
+    return await _run_read(_stats)
 
 async def get_dish_suggestions_by_ingredients(available: Iterable[str]) -> List[Dict[str, Any]]:
     normalized = {item.strip().lower() for item in available if item.strip()}
@@ -841,180 +1142,228 @@ async def get_dish_suggestions_by_ingredients(available: Iterable[str]) -> List[
         return []
 
     def _search() -> List[Dict[str, Any]]:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT d.id, d.name FROM dishes d ORDER BY d.name"
-        )
-        dishes = cursor.fetchall()
-        results: List[Dict[str, Any]] = []
-        for dish in dishes:
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS available_ingredients (name TEXT PRIMARY KEY)")
+            cursor.execute("DELETE FROM available_ingredients")
+            cursor.executemany(
+                "INSERT OR IGNORE INTO available_ingredients (name) VALUES (?)",
+                [(item,) for item in normalized],
+            )
             cursor.execute(
-                "SELECT name FROM dish_ingredients WHERE dish_id = ?",
-                (dish["id"],),
+                """
+                SELECT d.id, d.name,
+                       COUNT(a.name) AS matched_count,
+                       COUNT(*) AS total,
+                       GROUP_CONCAT(CASE WHEN a.name IS NOT NULL THEN i.key END, char(10)) AS matched,
+                       GROUP_CONCAT(CASE WHEN a.name IS NULL THEN i.key END, char(10)) AS missing
+                FROM dishes d
+                JOIN (
+                    SELECT DISTINCT dish_id, unicode_lower(TRIM(name)) AS key
+                    FROM dish_ingredients
+                    WHERE name IS NOT NULL AND name != ''
+                ) i ON i.dish_id = d.id
+                LEFT JOIN available_ingredients a ON a.name = i.key
+                GROUP BY d.id
+                HAVING matched_count > 0
+                ORDER BY 1.0 * matched_count / total DESC, d.name
+                """
             )
-            ing_names = {row[0].strip().lower() for row in cursor.fetchall() if row[0]}
-            if not ing_names:
-                continue
-            have = ing_names & normalized
-            missing = sorted(ing_names - normalized)
-            coverage = len(have) / len(ing_names)
-            if have:
-                results.append(
-                    {
-                        "dish_id": dish["id"],
-                        "name": dish["name"],
-                        "matched": sorted(have),
-                        "missing": missing,
-                        "coverage": coverage,
-                    }
-                )
-        conn.close()
-        results.sort(key=lambda item: item["coverage"], reverse=True)
-        return results
+            return [
+                {
+                    "dish_id": row["id"],
+                    "name": row["name"],
+                    "matched": sorted(row["matched"].split("\n")),
+                    "missing": sorted(row["missing"].split("\n")) if row["missing"] else [],
+                    "coverage": row["matched_count"] / row["total"],
+                }
+                for row in cursor.fetchall()
+            ]
 
-    return await _run_in_thread(_search)
+    return await _run_read(_search)
 
 
-async def export_data(user_id: str) -> Dict[str, str]:
-    dishes = await list_dishes()
-    plans = await get_meal_plans_in_range(user_id, "1970-01-01", "2999-12-31")
+DISH_EXPORT_FIELDS = [
+    "name",
+    "category",
+    "cuisine",
+    "servings",
+    "prep_time",
+    "cook_time",
+    "difficulty",
+    "is_favorite",
+    "tags",
+    "ingredients",
+    "recipe",
+    "description",
+    "notes",
+]
+PLAN_EXPORT_FIELDS = ["plan_date", "meal_type", "dish_name", "servings", "notes"]
 
-    dish_lines = [
-        "name,category,cuisine,servings,prep_time,cook_time,difficulty,is_favorite,tags,ingredients,recipe,description,notes"
-    ]
+
+def _format_export_ingredient(ingredient: Dict[str, Any]) -> str:
+    values = [ingredient.get(key) for key in ("quantity", "unit", "calories", "protein", "fat", "carbs")]
+    return "|".join([ingredient["name"], *("" if value is None else str(value) for value in values)])
+
+
+def _dish_export_rows(dishes: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Any, ...]]:
     for dish in dishes:
-        tags = ";".join(dish.get("tags", []))
-        ingredients_text = "; ".join(
-            [
-                f"{ing['name']}|{ing.get('quantity', '')}|{ing.get('unit', '')}|{ing.get('calories', '')}|{ing.get('protein', '')}|{ing.get('fat', '')}|{ing.get('carbs', '')}"
-                for ing in dish.get("ingredients_list", [])
-            ]
+        yield (
+            dish.get("name") or "",
+            dish.get("category") or "",
+            dish.get("cuisine") or "",
+            dish.get("servings") or "",
+            dish.get("prep_time") or "",
+            dish.get("cook_time") or "",
+            dish.get("difficulty") or "",
+            dish.get("is_favorite") or "",
+            ";".join(dish.get("tags", [])),
+            "; ".join(_format_export_ingredient(ing) for ing in dish.get("ingredients_list", [])),
+            dish.get("instructions") or dish.get("recipe") or "",
+            dish.get("description") or "",
+            dish.get("notes") or "",
         )
-        line = ",".join(
-            [
-                f'"{str(dish.get(key, "") or "").replace("\"", "''")}"'
-                for key in [
-                    "name",
-                    "category",
-                    "cuisine",
-                    "servings",
-                    "prep_time",
-                    "cook_time",
-                    "difficulty",
-                    "is_favorite",
-                    None,
-                    None,
-                    None,
-                    "description",
-                    "notes",
-                ]
-            ]
-        )
-        # Replace placeholders for tags and ingredients, recipe
-        line_parts = line.split(",")
-        line_parts[8] = f'"{tags}"'
-        line_parts[9] = f'"{ingredients_text}"'
-        line_parts[10] = f'"{(dish.get("instructions") or dish.get("recipe") or "").replace("\"", "''")}"'
-        dish_lines.append(",".join(line_parts))
-
-    plan_lines = ["plan_date,meal_type,dish_name,servings,notes"]
+
+
+def _plan_export_rows(plans: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Any, ...]]:
     for plan in plans:
-        plan_lines.append(
-            ",".join(
-                [
-                    plan.get("plan_date", ""),
-                    plan.get("meal_type", ""),
-                    plan.get("name", ""),
-                    str(plan.get("servings", "")),
-                    f'"{(plan.get("notes") or "").replace("\"", "''")}"',
-                ]
-            )
+        yield (
+            plan.get("plan_date", ""),
+            plan.get("meal_type", ""),
+            plan.get("name", ""),
+            plan.get("servings", ""),
+            plan.get("notes") or "",
         )
 
+
+async def export_tables(user_id: str) -> Dict[str, Tuple[Sequence[str], Iterator[Tuple[Any, ...]]]]:
+    dishes, plans = await asyncio.gather(
+        list_dishes(),
+        get_meal_plans_in_range(user_id, "1970-01-01", "2999-12-31"),
+    )
     return {
-        "dishes.csv": "\n".join(dish_lines),
-        "plan.csv": "\n".join(plan_lines),
+        "dishes.csv": (DISH_EXPORT_FIELDS, _dish_export_rows(dishes)),
+        "plan.csv": (PLAN_EXPORT_FIELDS, _plan_export_rows(plans)),
     }
 
 
-async def import_dishes(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
-    added = 0
-    skipped = []
-    for row in rows:
-        name = row.get("name", "").strip()
-        if not name:
-            continue
-        existing = await get_dish_by_name(name)
-        if existing:
-            skipped.append(name)
-            continue
+IMPORT_TRUE_VALUES = frozenset({"1", "true", "yes"})
 
-        tags = row.get("tags", "")
-        tag_list = [tag.strip() for tag in tags.split(";") if tag.strip()]
-        ingredients_text = row.get("ingredients", "")
-        ingredient_entries: List[Dict[str, Any]] = []
-        if ingredients_text:
-            for chunk in ingredients_text.split(";"):
-                parts = [part.strip() for part in chunk.split("|")]
-                if not parts or not parts[0]:
-                    continue
-                while len(parts) < 7:
-                    parts.append("")
-                ingredient_entries.append(
-                    {
-                        "name": parts[0],
-                        "quantity": float(parts[1]) if parts[1] else None,
-                        "unit": parts[2] or None,
-                        "calories": float(parts[3]) if parts[3] else None,
-                        "protein": float(parts[4]) if parts[4] else None,
-                        "fat": float(parts[5]) if parts[5] else None,
-                        "carbs": float(parts[6]) if parts[6] else None,
-                    }
-                )
-        try:
-            await add_dish(
-                {
-                    "name": name,
-                    "category": row.get("category"),
-                    "cuisine": row.get("cuisine"),
-                    "servings": float(row.get("servings")) if row.get("servings") else 1,
-                    "prep_time": int(float(row.get("prep_time"))) if row.get("prep_time") else 0,
-                    "cook_time": int(float(row.get("cook_time"))) if row.get("cook_time") else 0,
-                    "difficulty": row.get("difficulty"),
-                    "is_favorite": str(row.get("is_favorite", "")).strip() in {"1", "true", "True"},
-                    "instructions": row.get("recipe") or row.get("instructions"),
-                    "description": row.get("description"),
-                    "notes": row.get("notes"),
-                },
-                ingredient_entries,
-                tag_list,
-            )
-            added += 1
-        except ValueError:
-            skipped.append(name)
-    return {"added": added, "skipped": skipped}
 
+def _optional_float(value: str) -> Optional[float]:
+    return float(value) if value else None
 
 
-async def set_dish_tags(dish_id: int, tags: Sequence[str]) -> bool:
-    def _set() -> bool:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM dishes WHERE id = ?", (dish_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return False
-        cursor.execute("DELETE FROM dish_tags WHERE dish_id = ?", (dish_id,))
-        for tag in tags:
-            clean_tag = tag.strip().lower()
-            if clean_tag:
-                cursor.execute(
-                    "INSERT OR IGNORE INTO dish_tags (dish_id, tag) VALUES (?, ?)",
-                    (dish_id, clean_tag),
-                )
-        conn.commit()
-        conn.close()
-        return True
+def _parse_import_ingredients(ingredients_text: str) -> List[Dict[str, Any]]:
+    ingredient_entries: List[Dict[str, Any]] = []
+    for chunk in ingredients_text.split(";"):
+        parts = chunk.split("|")
+        name = parts[0].strip()
+        if not name:
+            continue
+        count = len(parts)
+        quantity, unit, calories, protein, fat, carbs = (
+            parts[index].strip() if index < count else "" for index in range(1, 7)
+        )
+        ingredient_entries.append(
+            {
+                "name": name,
+                "quantity": _optional_float(quantity),
+                "unit": unit or None,
+                "calories": _optional_float(calories),
+                "protein": _optional_float(protein),
+                "fat": _optional_float(fat),
+                "carbs": _optional_float(carbs),
+            }
+        )
+    return ingredient_entries
+
+
+def _parse_import_row(name: str, row: Dict[str, Any]) -> Tuple[Tuple[Any, ...], List[Dict[str, Any]], List[str]]:
+    tags = row.get("tags") or ""
+    tag_list = [tag.strip() for tag in tags.split(";") if tag.strip()]
+    ingredient_entries = _parse_import_ingredients(row.get("ingredients") or "")
+    instructions = row.get("recipe") or row.get("instructions") or ""
+    servings = row.get("servings")
+    prep_time = row.get("prep_time")
+    cook_time = row.get("cook_time")
+    is_favorite = str(row.get("is_favorite") or "").strip().lower() in IMPORT_TRUE_VALUES
+    dish_row = (
+        name,
+        row.get("description"),
+        instructions,
+        instructions,
+        row.get("category"),
+        row.get("cuisine"),
+        float(servings) if servings else 1,
+        int(float(prep_time)) if prep_time else 0,
+        int(float(cook_time)) if cook_time else 0,
+        row.get("difficulty"),
+        1 if is_favorite else 0,
+        None,
+        row.get("notes"),
+    )
+    return dish_row, ingredient_entries, tag_list
 
-    return await _run_in_thread(_set)
+
+async def import_dishes(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    def _import() -> Dict[str, Any]:
+        parsed: List[Tuple[str, Optional[Tuple[Tuple[Any, ...], List[Dict[str, Any]], List[str]]]]] = []
+        for row in rows:
+            name = (row.get("name") or "").strip()
+            if not name:
+                continue
+            try:
+                parsed.append((name, _parse_import_row(name, row)))
+            except ValueError:
+                parsed.append((name, None))
+
+        skipped: List[str] = []
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            seen = {row[0].lower() for row in cursor.execute("SELECT name FROM dishes")}
+            dish_rows: List[Tuple[Any, ...]] = []
+            pending: Dict[str, Tuple[List[Dict[str, Any]], List[str]]] = {}
+            for name, entry in parsed:
+                if entry is None or name.lower() in seen:
+                    skipped.append(name)
+                    continue
+                dish_row, ingredient_entries, tag_list = entry
+                seen.add(name.lower())
+                dish_rows.append(dish_row)
+                pending[name] = (ingredient_entries, tag_list)
+
+            if not dish_rows:
+                return {"added": 0, "skipped": skipped}
+
+            last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM dishes").fetchone()[0]
+            cursor.executemany(INSERT_DISH_SQL, dish_rows)
+            ingredient_rows: List[Tuple[Any, ...]] = []
+            tag_rows: List[Tuple[int, str]] = []
+            for dish_id, name in cursor.execute("SELECT id, name FROM dishes WHERE id > ?", (last_id,)).fetchall():
+                ingredient_entries, tag_list = pending[name]
+                ingredient_rows.extend(_ingredient_rows(dish_id, ingredient_entries))
+                tag_rows.extend(_tag_rows(dish_id, tag_list))
+            cursor.executemany(INSERT_INGREDIENT_SQL, ingredient_rows)
+            cursor.executemany(INSERT_TAG_SQL, tag_rows)
+            return {"added": len(dish_rows), "skipped": skipped}
+
+    result = await _run_write(_import)
+    invalidate_dish_lists()
+    return result
+
+
+async def set_dish_tags(dish_id: int, tags: Sequence[str], return_row: bool = False) -> DishWriteResult:
+    def _set() -> Tuple[bool, Optional[Dict[str, Any]]]:
+        with _write_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(DISH_EXISTS_SQL, (dish_id,))
+            if not cursor.fetchone():
+                return False, None
+            cursor.execute(DELETE_DISH_TAGS_SQL, (dish_id,))
+            cursor.executemany(INSERT_TAG_SQL, _tag_rows(dish_id, tags))
+            cursor.execute(f"UPDATE dishes SET updated_at = {NOW_SQL} WHERE id = ?", (dish_id,))
+            return True, _reload_dish(conn, dish_id) if return_row else None
+
+    updated, data = await _run_write(_set)
+    return _finish_dish_write(dish_id, updated, data, return_row)
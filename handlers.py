@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import asyncio
+import csv
 import io
 import zipfile
 from datetime import datetime, timedelta
-from typing import Dict, List
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Sequence, Tuple
 
 from telegram import (
     InlineKeyboardButton,
@@ -23,12 +26,14 @@ from telegram.ext import (
 
 import database
 from states import (
+    ReminderPayload,
     add_details_handler,
     add_dish_handler,
     delete_dish_handler,
     find_by_ingredients_handler,
     import_handler,
     plan_handler,
+    render_dish_text,
     scale_dish_handler,
     send_reminder_job,
     edit_dish_handler,
@@ -45,10 +50,41 @@ from utils import (
 )
 
 
+@lru_cache(maxsize=512)
+def _dish_keyboard(dish_id: int, is_favorite: bool) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    "★ Убрать из избранного" if is_favorite else "⭐️ В избранное",
+                    callback_data=f"toggle_favorite:{dish_id}",
+                ),
+                InlineKeyboardButton("🗓 В план", callback_data=f"plan_from_dish:{dish_id}"),
+            ],
+            [
+                InlineKeyboardButton("📏 Масштабировать", callback_data=f"scale_dish:{dish_id}"),
+                InlineKeyboardButton("📄 Экспорт блюда", callback_data=f"export_dish:{dish_id}"),
+            ],
+            [
+                InlineKeyboardButton("📤 Поделиться", callback_data=f"share_dish:{dish_id}"),
+            ],
+        ]
+    )
+
+
+@lru_cache(maxsize=64)
+def _dish_list_markup(items: Tuple[Tuple[int, str], ...]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(name, callback_data=f"view_dish:{dish_id}")] for dish_id, name in items]
+    )
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = str(update.effective_user.id)
-    summary = await database.get_dashboard_summary(user_id)
-    recent = await database.get_recent_actions(user_id)
+    summary, recent = await asyncio.gather(
+        database.get_dashboard_summary(user_id),
+        database.get_recent_actions(user_id),
+    )
     keyboard = ReplyKeyboardMarkup(
         build_main_keyboard_layout(summary),
         resize_keyboard=True,
@@ -85,16 +121,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 
 async def list_dishes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    dishes = await database.list_dishes()
+    dishes = await database.list_dish_summaries()
     message = update.effective_message
     if not dishes:
         await message.reply_text("Меню пустое. Добавьте блюдо с помощью команды 'Добавить блюдо'.")
         return
-    dish_names = "\n".join(f"• {dish['name']}" for dish in dishes)
-    buttons: List[List[InlineKeyboardButton]] = []
-    for dish in dishes[:30]:  # ограничимся 30 кнопками для компактности
-        buttons.append([InlineKeyboardButton(dish["name"], callback_data=f"view_dish:{dish['id']}")])
-    keyboard = InlineKeyboardMarkup(buttons) if buttons else None
+    dish_names = "• " + "\n• ".join([dish["name"] for dish in dishes])
+    keyboard = _dish_list_markup(tuple((dish["id"], dish["name"]) for dish in dishes[:30]))
     await message.reply_text("Текущие блюда:\n" + dish_names, reply_markup=keyboard)
 
 
@@ -112,49 +145,34 @@ async def view_dish_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         else:
             await update.message.reply_text("Блюдо не найдено. Добавьте его в меню.")
         return
-    await update.message.reply_text(format_dish_card(dish))
+    await update.message.reply_text(render_dish_text(dish, format_dish_card))
 
 
 async def view_dish_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    dish_id = int(query.data.split(":", 1)[1])
+    dish_id = int(context.matches[0].group(1))
     dish = await database.get_dish_by_id(dish_id)
     if not dish:
         await query.edit_message_text("Блюдо не найдено или было удалено.")
         return
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "★ Убрать из избранного" if dish.get("is_favorite") else "⭐️ В избранное",
-                    callback_data=f"toggle_favorite:{dish_id}",
-                ),
-                InlineKeyboardButton("🗓 В план", callback_data=f"plan_from_dish:{dish_id}"),
-            ],
-            [
-                InlineKeyboardButton("📏 Масштабировать", callback_data=f"scale_dish:{dish_id}"),
-                InlineKeyboardButton("📄 Экспорт блюда", callback_data=f"export_dish:{dish_id}"),
-            ],
-            [
-                InlineKeyboardButton("📤 Поделиться", callback_data=f"share_dish:{dish_id}"),
-            ],
-        ]
+    await query.message.reply_text(
+        render_dish_text(dish, format_dish_card),
+        reply_markup=_dish_keyboard(dish_id, bool(dish.get("is_favorite"))),
     )
-    await query.message.reply_text(format_dish_card(dish), reply_markup=keyboard)
 
 
 async def toggle_favorite_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    dish_id = int(query.data.split(":", 1)[1])
+    dish_id = int(context.matches[0].group(1))
     dish = await database.get_dish_by_id(dish_id)
     if not dish:
         await query.message.reply_text("Блюдо не найдено.")
         return
     new_value = not bool(dish.get("is_favorite"))
     await database.toggle_favorite(dish_id, new_value)
-    await database.log_action(str(update.effective_user.id), dish_id, "favorites_updated", {"is_favorite": new_value})
+    database.queue_action(str(update.effective_user.id), dish_id, "favorites_updated", {"is_favorite": new_value})
     text = "Добавлено в избранное" if new_value else "Удалено из избранного"
     await query.message.reply_text(text)
 
@@ -162,42 +180,40 @@ async def toggle_favorite_callback(update: Update, context: ContextTypes.DEFAULT
 async def share_dish_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    dish_id = int(query.data.split(":", 1)[1])
+    dish_id = int(context.matches[0].group(1))
     dish = await database.get_dish_by_id(dish_id)
     if not dish:
         await query.message.reply_text("Блюдо не найдено для отправки.")
         return
-    await query.message.reply_text("Скопируйте текст и поделитесь им:\n\n" + format_shareable_recipe(dish))
+    await query.message.reply_text("Скопируйте текст и поделитесь им:\n\n" + render_dish_text(dish, format_shareable_recipe))
 
 
 async def export_dish_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    dish_id = int(query.data.split(":", 1)[1])
+    dish_id = int(context.matches[0].group(1))
     dish = await database.get_dish_by_id(dish_id)
     if not dish:
         await query.message.reply_text("Блюдо не найдено для экспорта.")
         return
     buffer = io.BytesIO()
-    buffer.write(format_shareable_recipe(dish).encode("utf-8"))
+    buffer.write(render_dish_text(dish, format_shareable_recipe).encode("utf-8"))
     buffer.seek(0)
     filename = f"{dish['name']}.txt".replace("/", "-")
     await query.message.reply_document(InputFile(buffer, filename=filename), caption="Карточка блюда готова к скачиванию.")
 
 
 async def show_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    favorites = await database.list_favorites()
+    favorites = await database.list_dish_summaries(favorites_only=True)
     message = update.effective_message
     if not favorites:
         await message.reply_text("Избранных блюд пока нет. Добавьте их из карточки блюда кнопкой '⭐️'.")
         return
-    lines = ["Избранные блюда:"]
-    for dish in favorites:
-        lines.append(f"• {dish['name']}")
-    keyboard = InlineKeyboardMarkup(
-        [[InlineKeyboardButton(dish["name"], callback_data=f"view_dish:{dish['id']}")] for dish in favorites[:30]]
+    keyboard = _dish_list_markup(tuple((dish["id"], dish["name"]) for dish in favorites[:30]))
+    await message.reply_text(
+        "Избранные блюда:\n• " + "\n• ".join([dish["name"] for dish in favorites]),
+        reply_markup=keyboard,
     )
-    await message.reply_text("\n".join(lines), reply_markup=keyboard)
 
 
 async def plan_overview(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -219,63 +235,117 @@ async def shopping_list_handler(update: Update, context: ContextTypes.DEFAULT_TY
         format_shopping_items(result.get("items", []))
         + f"\n\nДиапазон: {start_date} — {end_date}",
     )
-    await database.log_action(user_id, None, "shopping_viewed", {"items": len(result.get("items", []))})
+    database.queue_action(user_id, None, "shopping_viewed", {"items": len(result.get("items", []))})
 
 
 async def statistics_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = str(update.effective_user.id)
-    stats = await database.get_user_statistics(user_id)
-    recent = await database.get_recent_actions(user_id)
+    stats, recent = await asyncio.gather(
+        database.get_user_statistics(user_id),
+        database.get_recent_actions(user_id),
+    )
     await update.effective_message.reply_text(format_statistics(stats, recent))
-    await database.log_action(user_id, None, "statistics_viewed", None)
+    database.queue_action(user_id, None, "statistics_viewed", None)
 
 
-async def export_all_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    user_id = str(update.effective_user.id)
-    data = await database.export_data(user_id)
+def _build_zip(tables: Dict[str, Tuple[Sequence[str], Iterable[Sequence[Any]]]]) -> io.BytesIO:
     buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
-        for filename, content in data.items():
-            archive.writestr(filename, content)
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for filename, (header, rows) in tables.items():
+            with archive.open(filename, "w", force_zip64=True) as raw, io.TextIOWrapper(
+                raw, encoding="utf-8", newline=""
+            ) as text:
+                writer = csv.writer(text)
+                writer.writerow(header)
+                writer.writerows(rows)
     buffer.seek(0)
+    return buffer
+
+
+async def export_all_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = str(update.effective_user.id)
+    tables = await database.export_tables(user_id)
+    buffer = await asyncio.to_thread(_build_zip, tables)
     await update.effective_message.reply_document(
         InputFile(buffer, filename="menu_export.zip"),
         caption="Экспорт завершён.",
     )
 
 
-async def schedule_existing_reminders(application: Application) -> None:
-    reminders = await database.get_pending_reminders()
+REMINDER_TICK_INTERVAL = 60
+REMINDER_LOOKAHEAD = timedelta(seconds=REMINDER_TICK_INTERVAL * 2)
+REMINDER_BATCH_LIMIT = 50
+
+
+async def _scheduler_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    application = context.application
     now = datetime.now()
+    reminders = await database.get_pending_reminders(
+        until=(now + REMINDER_LOOKAHEAD).isoformat(), limit=REMINDER_BATCH_LIMIT
+    )
+    scheduled = application.bot_data.get("scheduled_reminders", set())
+    pending_ids = set()
     for reminder in reminders:
+        pending_ids.add(reminder["id"])
+        if reminder["id"] in scheduled or application.job_queue.get_jobs_by_name(reminder.get("job_name") or ""):
+            continue
         try:
             remind_at = datetime.fromisoformat(reminder["remind_at"])
         except ValueError:
             continue
-        delta = remind_at - now
-        when = max(delta, timedelta(seconds=1))
-        job = application.job_queue.run_once(
+        when = max(remind_at - now, timedelta(seconds=1))
+        application.job_queue.run_once(
             send_reminder_job,
             when=when,
             name=reminder.get("job_name"),
-            data={
-                "chat_id": reminder["chat_id"],
-                "message": reminder["message"],
-                "reminder_time": reminder["remind_at"],
-                "reminder_id": reminder["id"],
-                "plan_id": reminder.get("plan_id"),
-                "dish_id": reminder.get("dish_id"),
-                "user_id": reminder.get("user_id"),
-            },
+            data=ReminderPayload(
+                chat_id=reminder["chat_id"],
+                message=reminder["message"],
+                reminder_time=reminder["remind_at"],
+                reminder_id=reminder["id"],
+                plan_id=reminder.get("plan_id"),
+                dish_id=reminder.get("dish_id"),
+                user_id=reminder.get("user_id"),
+                attempts=reminder.get("attempts") or 0,
+            ),
         )
-        if job and job.data is not None:
-            job.data["reminder_id"] = reminder["id"]
+    application.bot_data["scheduled_reminders"] = pending_ids
+
+
+async def schedule_existing_reminders(application: Application) -> None:
+    application.job_queue.run_repeating(
+        _scheduler_tick,
+        interval=REMINDER_TICK_INTERVAL,
+        first=0,
+        name="reminder_scheduler",
+    )
+
+
+MENU_ROUTES = {
+    "Меню": list_dishes,
+    "Избранное": show_favorites,
+    "Список покупок": shopping_list_handler,
+    "Статистика": statistics_handler,
+    "Экспорт": export_all_handler,
+    "План питания": plan_overview,
+    "Помощь": help_command,
+}
+
+
+async def menu_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await MENU_ROUTES[update.message.text](update, context)
 
 
 async def post_init(application: Application) -> None:
+    database.start_action_logger()
     await schedule_existing_reminders(application)
 
 
+async def post_shutdown(application: Application) -> None:
+    await database.stop_action_logger()
+    database.close_database()
+
+
 def register_handlers(app: Application) -> None:
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_command))
@@ -295,18 +365,13 @@ def register_handlers(app: Application) -> None:
     app.add_handler(find_by_ingredients_handler)
     app.add_handler(scale_dish_handler)
 
-    app.add_handler(MessageHandler(filters.Regex("^(Меню)$"), list_dishes))
-    app.add_handler(MessageHandler(filters.Regex("^(Избранное)$"), show_favorites))
-    app.add_handler(MessageHandler(filters.Regex("^(Список покупок)$"), shopping_list_handler))
-    app.add_handler(MessageHandler(filters.Regex("^(Статистика)$"), statistics_handler))
-    app.add_handler(MessageHandler(filters.Regex("^(Экспорт)$"), export_all_handler))
-    app.add_handler(MessageHandler(filters.Regex("^(План питания)$"), plan_overview))
-    app.add_handler(MessageHandler(filters.Regex("^(Помощь)$"), help_command))
+    app.add_handler(MessageHandler(filters.Text(frozenset(MENU_ROUTES)), menu_router))
 
-    app.add_handler(CallbackQueryHandler(view_dish_callback, pattern="^view_dish:"))
-    app.add_handler(CallbackQueryHandler(toggle_favorite_callback, pattern="^toggle_favorite:"))
-    app.add_handler(CallbackQueryHandler(export_dish_callback, pattern="^export_dish:"))
-    app.add_handler(CallbackQueryHandler(share_dish_callback, pattern="^share_dish:"))
+    app.add_handler(CallbackQueryHandler(view_dish_callback, pattern=r"^view_dish:(\d+)$"))
+    app.add_handler(CallbackQueryHandler(toggle_favorite_callback, pattern=r"^toggle_favorite:(\d+)$"))
+    app.add_handler(CallbackQueryHandler(export_dish_callback, pattern=r"^export_dish:(\d+)$"))
+    app.add_handler(CallbackQueryHandler(share_dish_callback, pattern=r"^share_dish:(\d+)$"))
 
     app.post_init = post_init
+    app.post_shutdown = post_shutdown
 
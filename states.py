@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 import csv
 import io
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import date, datetime, time, timedelta
-from typing import Any, Dict, List, Optional
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 from telegram import (
     InlineKeyboardButton,
@@ -12,6 +18,7 @@ from telegram import (
     ReplyKeyboardRemove,
     Update,
 )
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
 from telegram.ext import (
     CallbackQueryHandler,
     CommandHandler,
@@ -24,21 +31,20 @@ from telegram.ext import (
 import database
 from utils import (
     DIFFICULTY_LEVELS,
-    FINISH_INGREDIENT_KEYWORDS,
     MAIN_CATEGORIES,
     MEAL_TYPES,
-    NO_ANSWERS,
     SKIP_KEYWORD,
-    YES_ANSWERS,
     format_dish_card,
     format_scaled_ingredients,
     format_search_results,
+    is_finish_keyword,
     parse_date_input,
     parse_float,
     parse_ingredient_input,
     parse_int,
     parse_tags,
     parse_time_input,
+    parse_yes_no,
 )
 
 (
@@ -91,6 +97,43 @@ EDITABLE_FIELDS = {
 }
 
 
+MESSAGE_LIMIT = 4096
+PERSIST_CONVERSATIONS = bool(os.getenv("STATE_FILE"))
+REMINDER_MAX_ATTEMPTS = 5
+REMINDER_RETRY_DELAY = timedelta(minutes=1)
+
+logger = logging.getLogger(__name__)
+
+
+async def _reply_with_card(update: Update, card: str, prompt: str, reply_markup: Any) -> None:
+    text = card + "\n\n" + prompt
+    if len(text) <= MESSAGE_LIMIT:
+        await update.message.reply_text(text, reply_markup=reply_markup)
+        return
+    await update.message.reply_text(card)
+    await update.message.reply_text(prompt, reply_markup=reply_markup)
+
+
+EMPTY_TEXT_PROMPT = "Введите текст."
+StateHandler = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[Optional[int]]]
+TextHandler = Callable[[Update, ContextTypes.DEFAULT_TYPE, str], Awaitable[Optional[int]]]
+
+
+def require_nonempty_text(prompt: str = EMPTY_TEXT_PROMPT) -> Callable[[TextHandler], StateHandler]:
+    def decorator(handler: TextHandler) -> StateHandler:
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
+            text = (update.message.text or "").strip()
+            if not text:
+                await update.message.reply_text(prompt)
+                return None
+            return await handler(update, context, text)
+
+        return wrapper
+
+    return decorator
+
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if update.callback_query:
         await update.callback_query.answer("Действие отменено")
@@ -103,38 +146,153 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
-def _categories_keyboard() -> ReplyKeyboardMarkup:
-    rows = [[category] for category in MAIN_CATEGORIES]
-    rows.append([SKIP_KEYWORD])
+def _reply_keyboard(rows: List[List[str]]) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=True)
 
 
-def _difficulty_keyboard() -> ReplyKeyboardMarkup:
-    rows = [[difficulty] for difficulty in DIFFICULTY_LEVELS]
-    rows.append([SKIP_KEYWORD])
-    return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=True)
+_CATEGORIES_KEYBOARD = _reply_keyboard([[category] for category in MAIN_CATEGORIES] + [[SKIP_KEYWORD]])
+_DIFFICULTY_KEYBOARD = _reply_keyboard([[difficulty] for difficulty in DIFFICULTY_LEVELS] + [[SKIP_KEYWORD]])
+_MEAL_TYPE_KEYBOARD = _reply_keyboard([[meal] for meal in MEAL_TYPES])
+_YES_NO_KEYBOARD = _reply_keyboard([["Да", "Нет"]])
+_SKIP_KEYBOARD = _reply_keyboard([[SKIP_KEYWORD]])
+_FINISH_KEYBOARD = _reply_keyboard([["Готово"]])
+_FINISH_SKIP_KEYBOARD = _reply_keyboard([["Готово"], [SKIP_KEYWORD]])
+_EDIT_FIELDS_KEYBOARD = _reply_keyboard([[label] for label in EDITABLE_FIELDS])
+_REMOVE_KEYBOARD = ReplyKeyboardRemove()
+
+_EDIT_PROMPTS: Dict[str, Tuple[str, Any]] = {
+    "category": ("Выберите новую категорию или нажмите 'Пропустить'.", _CATEGORIES_KEYBOARD),
+    "difficulty": ("Выберите сложность или нажмите 'Пропустить'.", _DIFFICULTY_KEYBOARD),
+    "prep_time": ("Введите количество минут (целое число).", _REMOVE_KEYBOARD),
+    "cook_time": ("Введите количество минут (целое число).", _REMOVE_KEYBOARD),
+    "servings": ("Введите новое количество порций.", _REMOVE_KEYBOARD),
+    "tags": ("Перечислите теги через запятую.", _REMOVE_KEYBOARD),
+}
+_DEFAULT_EDIT_PROMPT = ("Введите новое значение.", _REMOVE_KEYBOARD)
 
 
-def _meal_type_keyboard() -> ReplyKeyboardMarkup:
-    rows = [[meal] for meal in MEAL_TYPES]
-    return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=True)
+CARD_OFFLOAD_THRESHOLD = 30
+
+
+DISH_TEXT_CACHE_SIZE = 256
+_DISH_TEXT_CACHE: "OrderedDict[Tuple[str, int, Optional[str]], str]" = OrderedDict()
+
+
+def _dish_text_key(formatter: Callable[..., str], dish: Dict[str, Any]) -> Tuple[str, int, Optional[str]]:
+    return (formatter.__name__, dish["id"], dish.get("updated_at"))
+
+
+def _cached_dish_text(key: Tuple[str, int, Optional[str]]) -> Optional[str]:
+    text = _DISH_TEXT_CACHE.get(key)
+    if text is not None:
+        _DISH_TEXT_CACHE.move_to_end(key)
+    return text
+
+
+def _remember_dish_text(key: Tuple[str, int, Optional[str]], text: str) -> None:
+    _DISH_TEXT_CACHE[key] = text
+    while len(_DISH_TEXT_CACHE) > DISH_TEXT_CACHE_SIZE:
+        _DISH_TEXT_CACHE.popitem(last=False)
+
 
+def render_dish_text(dish: Dict[str, Any], formatter: Callable[[Dict[str, Any]], str]) -> str:
+    key = _dish_text_key(formatter, dish)
+    text = _cached_dish_text(key)
+    if text is None:
+        text = formatter(dish)
+        _remember_dish_text(key, text)
+    return text
 
-def _yes_no_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup([["Да", "Нет"]], resize_keyboard=True, one_time_keyboard=True)
+
+async def _format_dish(formatter: Callable[..., str], dish: Dict[str, Any], *args: Any) -> str:
+    key = None if args else _dish_text_key(formatter, dish)
+    if key is not None:
+        text = _cached_dish_text(key)
+        if text is not None:
+            return text
+    if len(dish.get("ingredients_list") or ()) < CARD_OFFLOAD_THRESHOLD:
+        text = formatter(dish, *args)
+    else:
+        text = await asyncio.to_thread(formatter, dish, *args)
+    if key is not None:
+        _remember_dish_text(key, text)
+    return text
+
+
+def _validate_minutes(text: str) -> Tuple[Optional[int], Optional[str]]:
+    value = parse_int(text)
+    if value is None or value < 0:
+        return None, "Введите неотрицательное число минут."
+    return value, None
+
+
+def _validate_servings(text: str) -> Tuple[Optional[float], Optional[str]]:
+    value = parse_float(text)
+    if value is None or value <= 0:
+        return None, "Введите положительное число порций."
+    return value, None
+
+
+def _validate_text(text: str) -> Tuple[Optional[str], Optional[str]]:
+    return (None if text == SKIP_KEYWORD else text), None
+
+
+_EDIT_VALIDATORS: Dict[str, Callable[[str], Tuple[Any, Optional[str]]]] = {
+    "prep_time": _validate_minutes,
+    "cook_time": _validate_minutes,
+    "servings": _validate_servings,
+}
+
+
+@dataclass(slots=True)
+class AddDishState:
+    data: Dict[str, Any]
+    ingredients: List[Dict[str, Any]]
+
+
+@dataclass(slots=True)
+class DetailsState:
+    ingredients: Optional[List[Dict[str, Any]]]
+    dish: Optional[Dict[str, Any]] = None
+    instructions: Optional[str] = None
+
+
+@dataclass(slots=True)
+class EditState:
+    dish: Optional[Dict[str, Any]] = None
+    field: Optional[str] = None
+
+
+@dataclass(slots=True)
+class PlanState:
+    dish: Optional[Dict[str, Any]] = None
+    plan_date: Optional[date] = None
+    meal_type: Optional[str] = None
+    servings: Optional[float] = None
+    notes: Optional[str] = None
+    plan_id: Optional[int] = None
+
+
+@dataclass(frozen=True, slots=True)
+class ReminderPayload:
+    chat_id: int
+    message: str
+    reminder_time: str
+    reminder_id: Optional[int]
+    plan_id: Optional[int]
+    dish_id: Optional[int]
+    user_id: Optional[str]
+    attempts: int = 0
 
 
 async def add_dish_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data["add_dish"] = {"data": {}, "ingredients": [], "tags": []}
+    context.user_data["add_dish"] = AddDishState(data={}, ingredients=[])
     await update.message.reply_text("Введите название блюда.", reply_markup=ReplyKeyboardRemove())
     return ADD_NAME
 
 
-async def add_dish_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    name = update.message.text.strip()
-    if not name:
-        await update.message.reply_text("Название не может быть пустым. Попробуйте ещё раз.")
-        return ADD_NAME
+@require_nonempty_text("Название не может быть пустым. Попробуйте ещё раз.")
+async def add_dish_name(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str) -> int:
     existing = await database.get_dish_by_name(name)
     if existing:
         await update.message.reply_text(
@@ -142,29 +300,29 @@ async def add_dish_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
             "'Изменить блюдо'.",
         )
         return ADD_NAME
-    context.user_data.setdefault("add_dish", {})["data"]["name"] = name
+    context.user_data["add_dish"].data["name"] = name
     await update.message.reply_text(
         "Укажите категорию блюда или нажмите 'Пропустить'.",
-        reply_markup=_categories_keyboard(),
+        reply_markup=_CATEGORIES_KEYBOARD,
     )
     return ADD_CATEGORY
 
 
-async def add_dish_category(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
+@require_nonempty_text()
+async def add_dish_category(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
     if text != SKIP_KEYWORD:
-        context.user_data["add_dish"]["data"]["category"] = text
+        context.user_data["add_dish"].data["category"] = text
     await update.message.reply_text(
         "Укажите кухню (например, Русская, Итальянская) или нажмите 'Пропустить'.",
-        reply_markup=ReplyKeyboardMarkup([[SKIP_KEYWORD]], resize_keyboard=True, one_time_keyboard=True),
+        reply_markup=_SKIP_KEYBOARD,
     )
     return ADD_CUISINE
 
 
-async def add_dish_cuisine(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
+@require_nonempty_text()
+async def add_dish_cuisine(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
     if text != SKIP_KEYWORD:
-        context.user_data["add_dish"]["data"]["cuisine"] = text
+        context.user_data["add_dish"].data["cuisine"] = text
     await update.message.reply_text(
         "Сколько порций рассчитан рецепт? Введите число.",
         reply_markup=ReplyKeyboardRemove(),
@@ -177,7 +335,7 @@ async def add_dish_servings(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if servings is None or servings <= 0:
         await update.message.reply_text("Введите положительное число порций.")
         return ADD_SERVINGS
-    context.user_data["add_dish"]["data"]["servings"] = servings
+    context.user_data["add_dish"].data["servings"] = servings
     await update.message.reply_text("Сколько минут требуется на подготовку? Укажите число или 0, если не нужно.")
     return ADD_PREP_TIME
 
@@ -187,7 +345,7 @@ async def add_dish_prep_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if value is None or value < 0:
         await update.message.reply_text("Введите неотрицательное число минут подготовки.")
         return ADD_PREP_TIME
-    context.user_data["add_dish"]["data"]["prep_time"] = value
+    context.user_data["add_dish"].data["prep_time"] = value
     await update.message.reply_text("Сколько минут занимает готовка? Укажите число или 0, если неизвестно.")
     return ADD_COOK_TIME
 
@@ -197,44 +355,43 @@ async def add_dish_cook_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if value is None or value < 0:
         await update.message.reply_text("Введите неотрицательное число минут готовки.")
         return ADD_COOK_TIME
-    context.user_data["add_dish"]["data"]["cook_time"] = value
+    context.user_data["add_dish"].data["cook_time"] = value
     await update.message.reply_text(
         "Укажите сложность рецепта или нажмите 'Пропустить'.",
-        reply_markup=_difficulty_keyboard(),
+        reply_markup=_DIFFICULTY_KEYBOARD,
     )
     return ADD_DIFFICULTY
 
 
-async def add_dish_difficulty(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
+@require_nonempty_text()
+async def add_dish_difficulty(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
     if text != SKIP_KEYWORD:
-        context.user_data["add_dish"]["data"]["difficulty"] = text
+        context.user_data["add_dish"].data["difficulty"] = text
     await update.message.reply_text(
         "Добавьте краткое описание блюда или нажмите 'Пропустить'.",
-        reply_markup=ReplyKeyboardMarkup([[SKIP_KEYWORD]], resize_keyboard=True, one_time_keyboard=True),
+        reply_markup=_SKIP_KEYBOARD,
     )
     return ADD_DESCRIPTION
 
 
-async def add_dish_description(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
+@require_nonempty_text()
+async def add_dish_description(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
     if text != SKIP_KEYWORD:
-        context.user_data["add_dish"]["data"]["description"] = text
+        context.user_data["add_dish"].data["description"] = text
     await update.message.reply_text(
         "Перечисляйте ингредиенты по одному в формате:\n"
         "Название; количество; единица; калории; белки; жиры; углеводы.\n"
         "Когда закончите, напишите 'Готово'.",
-        reply_markup=ReplyKeyboardMarkup([["Готово"]], resize_keyboard=True, one_time_keyboard=True),
+        reply_markup=_FINISH_KEYBOARD,
     )
     return ADD_INGREDIENTS
 
 
-async def add_dish_ingredients(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
-    lower = text.lower()
-    data = context.user_data["add_dish"]
-    if lower in FINISH_INGREDIENT_KEYWORDS:
-        if not data["ingredients"]:
+@require_nonempty_text()
+async def add_dish_ingredients(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
+    state: AddDishState = context.user_data["add_dish"]
+    if is_finish_keyword(text):
+        if not state.ingredients:
             await update.message.reply_text(
                 "Чтобы бот мог построить список покупок и подсчитать калории, добавьте хотя бы один ингредиент.",
             )
@@ -246,56 +403,50 @@ async def add_dish_ingredients(update: Update, context: ContextTypes.DEFAULT_TYP
     except ValueError as error:
         await update.message.reply_text(f"Не удалось распознать ингредиент: {error}")
         return ADD_INGREDIENTS
-    data["ingredients"].append(ingredient)
+    state.ingredients.append(ingredient)
     await update.message.reply_text("Добавлено. Введите следующий ингредиент или напишите 'Готово'.")
     return ADD_INGREDIENTS
 
 
-async def add_dish_instructions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    instructions = update.message.text.strip()
-    if not instructions:
-        await update.message.reply_text("Рецепт не может быть пустым. Опишите шаги приготовления.")
-        return ADD_INSTRUCTIONS
-    context.user_data["add_dish"]["data"]["instructions"] = instructions
+@require_nonempty_text("Рецепт не может быть пустым. Опишите шаги приготовления.")
+async def add_dish_instructions(update: Update, context: ContextTypes.DEFAULT_TYPE, instructions: str) -> int:
+    context.user_data["add_dish"].data["instructions"] = instructions
     await update.message.reply_text(
         "Перечислите теги через запятую (например: веганское, быстро) или нажмите 'Пропустить'.",
-        reply_markup=ReplyKeyboardMarkup([[SKIP_KEYWORD]], resize_keyboard=True, one_time_keyboard=True),
+        reply_markup=_SKIP_KEYBOARD,
     )
     return ADD_TAGS
 
 
-async def add_dish_tags(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
+@require_nonempty_text()
+async def add_dish_tags(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
     tags: List[str] = []
     if text != SKIP_KEYWORD:
         tags = parse_tags(text)
-    payload = context.user_data.pop("add_dish", {})
-    data = payload.get("data", {})
-    ingredients = payload.get("ingredients", [])
+    state: AddDishState = context.user_data.pop("add_dish")
+    data = state.data
     user_id = str(update.effective_user.id)
     try:
-        dish_id = await database.add_dish(data, ingredients, tags)
+        dish = await database.add_dish(data, state.ingredients, tags, return_row=True)
     except ValueError as error:
         await update.message.reply_text(str(error))
         return ConversationHandler.END
-    dish = await database.get_dish_by_id(dish_id)
-    if dish:
-        await update.message.reply_text(
-            "Блюдо успешно сохранено! Вот его карточка:\n" + format_dish_card(dish),
-            reply_markup=ReplyKeyboardRemove(),
-        )
-    await database.log_action(user_id, dish_id, "dish_added", {"name": data.get("name")})
+    await update.message.reply_text(
+        "Блюдо успешно сохранено! Вот его карточка:\n" + await _format_dish(format_dish_card, dish),
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    database.queue_action(user_id, dish["id"], "dish_added", {"name": data.get("name")})
     return ConversationHandler.END
 
 
 async def add_details_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data["details"] = {"ingredients": []}
+    context.user_data["details"] = DetailsState(ingredients=[])
     await update.message.reply_text("Введите название блюда, которое хотите дополнить.")
     return DETAILS_SELECT
 
 
-async def add_details_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    name = update.message.text.strip()
+@require_nonempty_text()
+async def add_details_select(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str) -> int:
     dish = await database.get_dish_by_name(name)
     if not dish:
         matches = await database.search_dish_names(name, limit=3)
@@ -305,29 +456,28 @@ async def add_details_select(update: Update, context: ContextTypes.DEFAULT_TYPE)
         else:
             await update.message.reply_text("Блюдо не найдено. Убедитесь, что оно добавлено в меню.")
         return DETAILS_SELECT
-    context.user_data["details"]["dish"] = dish
-    context.user_data["details"]["ingredients"] = []
-    await update.message.reply_text(
-        "Текущая карточка блюда:\n" + format_dish_card(dish)
-    )
-    await update.message.reply_text(
+    state: DetailsState = context.user_data["details"]
+    state.dish = dish
+    state.ingredients = []
+    await _reply_with_card(
+        update,
+        "Текущая карточка блюда:\n" + await _format_dish(format_dish_card, dish),
         "Введите новые ингредиенты в формате 'Название; количество; единица; ...'.\n"
         "Отправьте несколько сообщений по одному ингредиенту. Напишите 'Готово', чтобы оставить текущий список.",
-        reply_markup=ReplyKeyboardMarkup([["Готово"], [SKIP_KEYWORD]], resize_keyboard=True, one_time_keyboard=True),
+        _FINISH_SKIP_KEYBOARD,
     )
     return DETAILS_INGREDIENTS
 
 
-async def add_details_ingredients(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
-    lower = text.lower()
-    details_data = context.user_data["details"]
-    if lower in FINISH_INGREDIENT_KEYWORDS or text == SKIP_KEYWORD:
-        if not details_data["ingredients"]:
-            details_data["ingredients"] = None  # оставить без изменений
+@require_nonempty_text()
+async def add_details_ingredients(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
+    state: DetailsState = context.user_data["details"]
+    if text == SKIP_KEYWORD or is_finish_keyword(text):
+        if not state.ingredients:
+            state.ingredients = None  # оставить без изменений
         await update.message.reply_text(
             "Опишите новый рецепт или нажмите 'Пропустить', чтобы оставить существующий.",
-            reply_markup=ReplyKeyboardMarkup([[SKIP_KEYWORD]], resize_keyboard=True, one_time_keyboard=True),
+            reply_markup=_SKIP_KEYBOARD,
         )
         return DETAILS_INSTRUCTIONS
     try:
@@ -335,54 +485,53 @@ async def add_details_ingredients(update: Update, context: ContextTypes.DEFAULT_
     except ValueError as error:
         await update.message.reply_text(f"Ошибка: {error}. Попробуйте ещё раз.")
         return DETAILS_INGREDIENTS
-    details_data["ingredients"].append(ingredient)
+    state.ingredients.append(ingredient)
     await update.message.reply_text("Добавлено. Введите следующий ингредиент или напишите 'Готово'.")
     return DETAILS_INGREDIENTS
 
 
-async def add_details_instructions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
+@require_nonempty_text()
+async def add_details_instructions(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
     if text != SKIP_KEYWORD:
-        context.user_data["details"]["instructions"] = text
+        context.user_data["details"].instructions = text
     await update.message.reply_text(
         "Введите обновлённые теги или нажмите 'Пропустить'.",
-        reply_markup=ReplyKeyboardMarkup([[SKIP_KEYWORD]], resize_keyboard=True, one_time_keyboard=True),
+        reply_markup=_SKIP_KEYBOARD,
     )
     return DETAILS_TAGS
 
 
-async def add_details_tags(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
-    details_data = context.user_data.pop("details", {})
-    dish = details_data.get("dish")
+@require_nonempty_text()
+async def add_details_tags(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
+    state: Optional[DetailsState] = context.user_data.pop("details", None)
+    dish = state.dish if state else None
     if not dish:
         await update.message.reply_text("Что-то пошло не так — блюдо не найдено.")
         return ConversationHandler.END
-    ingredients_input = details_data.get("ingredients")
-    if ingredients_input is None:
-        ingredients = dish.get("ingredients_list", [])
-    else:
-        ingredients = ingredients_input
-    instructions = details_data.get("instructions") if "instructions" in details_data else None
+    ingredients = dish.get("ingredients_list", []) if state.ingredients is None else state.ingredients
     tags = dish.get("tags") if text == SKIP_KEYWORD else parse_tags(text)
-    await database.replace_dish_details(dish["id"], ingredients, instructions=instructions, tags=tags)
-    updated = await database.get_dish_by_id(dish["id"])
+    updated = await database.replace_dish_details(
+        dish["id"], ingredients, instructions=state.instructions, tags=tags, return_row=True
+    )
+    if not updated:
+        await update.message.reply_text("Блюдо не найдено или было удалено.", reply_markup=ReplyKeyboardRemove())
+        return ConversationHandler.END
     await update.message.reply_text(
-        "Блюдо обновлено:\n" + format_dish_card(updated),
+        "Блюдо обновлено:\n" + await _format_dish(format_dish_card, updated),
         reply_markup=ReplyKeyboardRemove(),
     )
-    await database.log_action(str(update.effective_user.id), dish["id"], "details_updated", {"name": dish.get("name")})
+    database.queue_action(str(update.effective_user.id), dish["id"], "details_updated", {"name": dish.get("name")})
     return ConversationHandler.END
 
 
 async def edit_dish_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text("Введите название блюда, которое хотите изменить.")
-    context.user_data["edit_dish"] = {}
+    context.user_data["edit_dish"] = EditState()
     return EDIT_SELECT
 
 
-async def edit_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    name = update.message.text.strip()
+@require_nonempty_text()
+async def edit_select(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str) -> int:
     dish = await database.get_dish_by_name(name)
     if not dish:
         matches = await database.search_dish_names(name, limit=3)
@@ -392,20 +541,14 @@ async def edit_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         else:
             await update.message.reply_text("Такого блюда нет. Попробуйте снова.")
         return EDIT_SELECT
-    context.user_data["edit_dish"]["dish"] = dish
-    await update.message.reply_text(
-        "Текущие данные:\n" + format_dish_card(dish)
-    )
-    keyboard_rows = [[label] for label in EDITABLE_FIELDS.keys()]
-    await update.message.reply_text(
-        "Что нужно изменить?",
-        reply_markup=ReplyKeyboardMarkup(keyboard_rows, resize_keyboard=True, one_time_keyboard=True),
-    )
+    context.user_data["edit_dish"].dish = dish
+    card = "Текущие данные:\n" + await _format_dish(format_dish_card, dish)
+    await _reply_with_card(update, card, "Что нужно изменить?", _EDIT_FIELDS_KEYBOARD)
     return EDIT_FIELD
 
 
-async def edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    choice = update.message.text.strip()
+@require_nonempty_text()
+async def edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE, choice: str) -> int:
     field = EDITABLE_FIELDS.get(choice)
     if field is None and choice != "Готово":
         await update.message.reply_text("Выберите опцию из списка.")
@@ -414,93 +557,55 @@ async def edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         context.user_data.pop("edit_dish", None)
         await update.message.reply_text("Изменения сохранены.", reply_markup=ReplyKeyboardRemove())
         return ConversationHandler.END
-    dish = context.user_data["edit_dish"].get("dish")
+    state: EditState = context.user_data["edit_dish"]
+    dish = state.dish
     if not dish:
         await update.message.reply_text("Не удалось найти блюдо. Начните сначала.")
         return ConversationHandler.END
-    context.user_data["edit_dish"]["field"] = field
+    state.field = field
     if field == "is_favorite":
         new_value = not bool(dish.get("is_favorite"))
-        await database.toggle_favorite(dish["id"], new_value)
-        updated = await database.get_dish_by_id(dish["id"])
-        context.user_data["edit_dish"]["dish"] = updated
+        updated = await database.toggle_favorite(dish["id"], new_value, return_row=True)
+        state.dish = updated
         await update.message.reply_text(
             "Статус избранного обновлён. Хотите изменить что-то ещё?",
-            reply_markup=ReplyKeyboardMarkup([[label] for label in EDITABLE_FIELDS.keys()], resize_keyboard=True, one_time_keyboard=True),
+            reply_markup=_EDIT_FIELDS_KEYBOARD,
         )
-        await database.log_action(str(update.effective_user.id), dish["id"], "favorites_updated", {"name": dish.get("name")})
+        database.queue_action(str(update.effective_user.id), dish["id"], "favorites_updated", {"name": dish.get("name")})
         return EDIT_FIELD
-    if field == "category":
-        await update.message.reply_text(
-            "Выберите новую категорию или нажмите 'Пропустить'.",
-            reply_markup=_categories_keyboard(),
-        )
-        return EDIT_VALUE
-    if field == "difficulty":
-        await update.message.reply_text("Выберите сложность или нажмите 'Пропустить'.", reply_markup=_difficulty_keyboard())
-        return EDIT_VALUE
-    if field in {"prep_time", "cook_time"}:
-        await update.message.reply_text("Введите количество минут (целое число).", reply_markup=ReplyKeyboardRemove())
-        return EDIT_VALUE
-    if field == "servings":
-        await update.message.reply_text("Введите новое количество порций.", reply_markup=ReplyKeyboardRemove())
-        return EDIT_VALUE
-    if field == "tags":
-        await update.message.reply_text(
-            "Перечислите теги через запятую.",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        return EDIT_VALUE
-    await update.message.reply_text("Введите новое значение.", reply_markup=ReplyKeyboardRemove())
+    prompt, keyboard = _EDIT_PROMPTS.get(field, _DEFAULT_EDIT_PROMPT)
+    await update.message.reply_text(prompt, reply_markup=keyboard)
     return EDIT_VALUE
 
 
-async def edit_value(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
-    data = context.user_data.get("edit_dish")
-    if not data:
+@require_nonempty_text()
+async def edit_value(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
+    state: Optional[EditState] = context.user_data.get("edit_dish")
+    if not state:
         await update.message.reply_text("Контекст редактирования утерян. Начните сначала.")
         return ConversationHandler.END
-    dish = data.get("dish")
-    field = data.get("field")
+    dish = state.dish
+    field = state.field
     if not dish or not field:
         await update.message.reply_text("Не удалось обновить блюдо. Попробуйте снова.")
         return ConversationHandler.END
-    updates: Dict[str, Any] = {}
     if field == "tags":
         tags = parse_tags(text)
-        await database.set_dish_tags(dish["id"], tags)
+        updated = await database.set_dish_tags(dish["id"], tags, return_row=True)
     else:
-        if field in {"prep_time", "cook_time"}:
-            value = parse_int(text)
-            if value is None or value < 0:
-                await update.message.reply_text("Введите неотрицательное число минут.")
-                return EDIT_VALUE
-            updates[field] = value
-        elif field == "servings":
-            value = parse_float(text)
-            if value is None or value <= 0:
-                await update.message.reply_text("Введите положительное число порций.")
-                return EDIT_VALUE
-            updates[field] = value
-        else:
-            if text == SKIP_KEYWORD:
-                updates[field] = None
-            else:
-                updates[field] = text
-        if updates:
-            await database.update_dish(dish["id"], updates)
-    updated = await database.get_dish_by_id(dish["id"])
-    context.user_data["edit_dish"]["dish"] = updated
-    await update.message.reply_text(
-        "Обновлённая карточка:\n" + format_dish_card(updated),
-    )
-    await database.log_action(str(update.effective_user.id), dish["id"], "dish_updated", {"field": field})
-    keyboard_rows = [[label] for label in EDITABLE_FIELDS.keys()]
-    await update.message.reply_text(
-        "Изменить что-то ещё?",
-        reply_markup=ReplyKeyboardMarkup(keyboard_rows, resize_keyboard=True, one_time_keyboard=True),
-    )
+        value, error = _EDIT_VALIDATORS.get(field, _validate_text)(text)
+        if error:
+            await update.message.reply_text(error)
+            return EDIT_VALUE
+        updated = await database.update_dish(dish["id"], {field: value}, return_row=True)
+    if not updated:
+        context.user_data.pop("edit_dish", None)
+        await update.message.reply_text("Блюдо не найдено или было удалено.", reply_markup=ReplyKeyboardRemove())
+        return ConversationHandler.END
+    state.dish = updated
+    database.queue_action(str(update.effective_user.id), dish["id"], "dish_updated", {"field": field})
+    card = "Обновлённая карточка:\n" + await _format_dish(format_dish_card, updated)
+    await _reply_with_card(update, card, "Изменить что-то ещё?", _EDIT_FIELDS_KEYBOARD)
     return EDIT_FIELD
 
 
@@ -509,24 +614,23 @@ async def delete_dish_entry(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return DELETE_SELECT
 
 
-async def delete_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    name = update.message.text.strip()
+@require_nonempty_text()
+async def delete_select(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str) -> int:
     dish = await database.get_dish_by_name(name)
     if not dish:
         await update.message.reply_text("Блюдо не найдено. Проверьте название и попробуйте снова.")
         return DELETE_SELECT
     context.user_data["delete_dish"] = dish
     await update.message.reply_text(
-        "Вы собираетесь удалить:\n" + format_dish_card(dish) + "\nВы уверены?",
-        reply_markup=_yes_no_keyboard(),
+        "Вы собираетесь удалить:\n" + await _format_dish(format_dish_card, dish) + "\nВы уверены?",
+        reply_markup=_YES_NO_KEYBOARD,
     )
     return DELETE_CONFIRM
 
 
 async def delete_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    answer = update.message.text.strip().lower()
     dish = context.user_data.pop("delete_dish", None)
-    if answer in NO_ANSWERS or answer == "нет":
+    if parse_yes_no(update.message.text) is False:
         await update.message.reply_text("Удаление отменено.", reply_markup=ReplyKeyboardRemove())
         return ConversationHandler.END
     if not dish:
@@ -534,12 +638,12 @@ async def delete_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return ConversationHandler.END
     await database.delete_dish(dish["id"])
     await update.message.reply_text(f"Блюдо '{dish.get('name')}' удалено.", reply_markup=ReplyKeyboardRemove())
-    await database.log_action(str(update.effective_user.id), dish["id"], "dish_deleted", {"name": dish.get("name")})
+    database.queue_action(str(update.effective_user.id), dish["id"], "dish_deleted", {"name": dish.get("name")})
     return ConversationHandler.END
 
 
 async def plan_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data["plan"] = {}
+    context.user_data["plan"] = PlanState()
     if update.callback_query:
         await update.callback_query.answer()
         await update.callback_query.message.reply_text(
@@ -554,12 +658,12 @@ async def plan_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def plan_from_dish_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    dish_id = int(query.data.split(":", 1)[1])
+    dish_id = int(context.matches[0].group(1))
     dish = await database.get_dish_by_id(dish_id)
     if not dish:
         await query.edit_message_text("Блюдо не найдено. Попробуйте снова через меню.")
         return ConversationHandler.END
-    context.user_data["plan"] = {"dish": dish}
+    context.user_data["plan"] = PlanState(dish=dish)
     await query.message.reply_text(
         "Укажите дату (например, 2024-05-20, сегодня или завтра).",
         reply_markup=ReplyKeyboardRemove(),
@@ -567,8 +671,8 @@ async def plan_from_dish_callback(update: Update, context: ContextTypes.DEFAULT_
     return PLAN_SET_DATE
 
 
-async def plan_choose_dish(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    name = update.message.text.strip()
+@require_nonempty_text()
+async def plan_choose_dish(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str) -> int:
     dish = await database.get_dish_by_name(name)
     if not dish:
         matches = await database.search_dish_names(name, limit=3)
@@ -578,7 +682,7 @@ async def plan_choose_dish(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         else:
             await update.message.reply_text("Блюдо не найдено. Попробуйте снова.")
         return PLAN_CHOOSE_DISH
-    context.user_data.setdefault("plan", {})["dish"] = dish
+    context.user_data.setdefault("plan", PlanState()).dish = dish
     await update.message.reply_text(
         "Укажите дату приготовления (например, 2024-05-20, сегодня или завтра).",
     )
@@ -593,29 +697,31 @@ async def plan_set_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     if plan_date < date.today():
         await update.message.reply_text("Дата не может быть в прошлом.")
         return PLAN_SET_DATE
-    context.user_data["plan"]["date"] = plan_date.isoformat()
-    await update.message.reply_text("На какой приём пищи поставить блюдо?", reply_markup=_meal_type_keyboard())
+    context.user_data["plan"].plan_date = plan_date
+    await update.message.reply_text("На какой приём пищи поставить блюдо?", reply_markup=_MEAL_TYPE_KEYBOARD)
     return PLAN_SET_MEAL
 
 
-async def plan_set_meal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    meal_type = update.message.text.strip()
+@require_nonempty_text()
+async def plan_set_meal(update: Update, context: ContextTypes.DEFAULT_TYPE, meal_type: str) -> int:
     if meal_type not in MEAL_TYPES:
         await update.message.reply_text("Выберите приём пищи из списка.")
         return PLAN_SET_MEAL
-    context.user_data["plan"]["meal_type"] = meal_type
-    dish = context.user_data["plan"].get("dish")
+    state: PlanState = context.user_data["plan"]
+    state.meal_type = meal_type
+    dish = state.dish
     suggestion = dish.get("servings") if dish else 1
     await update.message.reply_text(
         f"Сколько порций приготовить? (по умолчанию {suggestion})",
-        reply_markup=ReplyKeyboardMarkup([[SKIP_KEYWORD]], resize_keyboard=True, one_time_keyboard=True),
+        reply_markup=_SKIP_KEYBOARD,
     )
     return PLAN_SET_SERVINGS
 
 
-async def plan_set_servings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
-    dish = context.user_data["plan"].get("dish")
+@require_nonempty_text()
+async def plan_set_servings(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
+    state: PlanState = context.user_data["plan"]
+    dish = state.dish
     if text == SKIP_KEYWORD:
         servings = dish.get("servings", 1) if dish else 1
     else:
@@ -623,20 +729,20 @@ async def plan_set_servings(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if servings is None or servings <= 0:
             await update.message.reply_text("Введите положительное число или нажмите 'Пропустить'.")
             return PLAN_SET_SERVINGS
-    context.user_data["plan"]["servings"] = servings
+    state.servings = servings
     await update.message.reply_text(
         "Добавьте заметку (например, 'приготовить заранее') или нажмите 'Пропустить'.",
-        reply_markup=ReplyKeyboardMarkup([[SKIP_KEYWORD]], resize_keyboard=True, one_time_keyboard=True),
+        reply_markup=_SKIP_KEYBOARD,
     )
     return PLAN_SET_NOTES
 
 
-async def plan_set_notes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
+@require_nonempty_text()
+async def plan_set_notes(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
+    state: PlanState = context.user_data["plan"]
     if text != SKIP_KEYWORD:
-        context.user_data["plan"]["notes"] = text
-    plan_data = context.user_data.get("plan", {})
-    dish = plan_data.get("dish")
+        state.notes = text
+    dish = state.dish
     if not dish:
         await update.message.reply_text("Не удалось определить блюдо. Начните сначала.")
         return ConversationHandler.END
@@ -644,27 +750,27 @@ async def plan_set_notes(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         user_id=str(update.effective_user.id),
         chat_id=update.effective_chat.id,
         dish_id=dish["id"],
-        plan_date=plan_data["date"],
-        meal_type=plan_data["meal_type"],
-        servings=plan_data.get("servings", dish.get("servings", 1)),
-        notes=plan_data.get("notes"),
+        plan_date=state.plan_date.isoformat(),
+        meal_type=state.meal_type,
+        servings=state.servings if state.servings is not None else dish.get("servings", 1),
+        notes=state.notes,
     )
-    context.user_data["plan"]["plan_id"] = plan_id
+    state.plan_id = plan_id
+    database.queue_action(str(update.effective_user.id), dish["id"], "plan_created", {"plan_id": plan_id})
     await update.message.reply_text(
         "Блюдо добавлено в план! Желаете установить напоминание?",
-        reply_markup=_yes_no_keyboard(),
+        reply_markup=_YES_NO_KEYBOARD,
     )
-    await database.log_action(str(update.effective_user.id), dish["id"], "plan_created", {"plan_id": plan_id})
     return PLAN_CONFIRM_REMINDER
 
 
 async def plan_confirm_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    answer = update.message.text.strip().lower()
-    if answer in NO_ANSWERS or answer == "нет":
+    answer = parse_yes_no(update.message.text)
+    if answer is False:
         context.user_data.pop("plan", None)
         await update.message.reply_text("Готово! План обновлён.", reply_markup=ReplyKeyboardRemove())
         return ConversationHandler.END
-    if answer not in YES_ANSWERS and answer != "да":
+    if answer is None:
         await update.message.reply_text("Ответьте 'Да' или 'Нет'.")
         return PLAN_CONFIRM_REMINDER
     await update.message.reply_text(
@@ -674,68 +780,96 @@ async def plan_confirm_reminder(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 async def plan_set_reminder_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    plan_data = context.user_data.get("plan")
-    if not plan_data:
+    state: Optional[PlanState] = context.user_data.get("plan")
+    if not state:
         await update.message.reply_text("Контекст напоминания утерян. Попробуйте снова.")
         return ConversationHandler.END
     reminder_time = parse_time_input(update.message.text)
     if not reminder_time:
         await update.message.reply_text("Не удалось распознать время. Используйте формат ЧЧ:ММ.")
         return PLAN_SET_REMINDER_TIME
-    plan_date = datetime.strptime(plan_data["date"], "%Y-%m-%d").date()
+    plan_date = state.plan_date
     remind_dt = datetime.combine(plan_date, reminder_time)
     now = datetime.now()
     if remind_dt <= now:
         await update.message.reply_text("Время уже прошло. Укажите более позднее время.")
         return PLAN_SET_REMINDER_TIME
-    dish = plan_data.get("dish")
-    plan_id = plan_data.get("plan_id")
+    dish = state.dish
+    plan_id = state.plan_id
     job_name = f"reminder_{plan_id}_{int(remind_dt.timestamp())}"
     message = (
-        f"⏰ Напоминание: {dish.get('name')} — {plan_data.get('meal_type')} {plan_date.isoformat()}"
-    )
-    job = context.application.job_queue.run_once(
-        callback=send_reminder_job,
-        when=(remind_dt - now),
-        name=job_name,
-        data={
-            "chat_id": update.effective_chat.id,
-            "message": message,
-            "reminder_time": remind_dt.isoformat(),
-            "reminder_id": None,
-            "plan_id": plan_id,
-            "dish_id": dish.get("id"),
-            "user_id": str(update.effective_user.id),
-        },
+        f"⏰ Напоминание: {dish.get('name')} — {state.meal_type} {plan_date.isoformat()}"
     )
+    user_id = str(update.effective_user.id)
+    remind_at = remind_dt.isoformat()
     reminder_id = await database.add_reminder(
-        user_id=str(update.effective_user.id),
+        user_id=user_id,
         chat_id=update.effective_chat.id,
-        remind_at=remind_dt.isoformat(),
+        remind_at=remind_at,
         message=message,
         job_name=job_name,
         plan_id=plan_id,
         dish_id=dish.get("id"),
     )
-    if job and job.data is not None:
-        job.data["reminder_id"] = reminder_id
-    await database.log_action(str(update.effective_user.id), dish.get("id"), "reminder_scheduled", {"reminder_id": reminder_id})
-    await update.message.reply_text("Готово! Напоминание сохранено.")
+    job_queue = context.application.job_queue
+    if not job_queue.get_jobs_by_name(job_name):
+        job_queue.run_once(
+            callback=send_reminder_job,
+            when=max(remind_dt - datetime.now(), timedelta(seconds=1)),
+            name=job_name,
+            data=ReminderPayload(
+                chat_id=update.effective_chat.id,
+                message=message,
+                reminder_time=remind_at,
+                reminder_id=reminder_id,
+                plan_id=plan_id,
+                dish_id=dish.get("id"),
+                user_id=user_id,
+            ),
+        )
+    database.queue_action(user_id, dish.get("id"), "reminder_scheduled", {"reminder_id": reminder_id})
     context.user_data.pop("plan", None)
+    await update.message.reply_text("Готово! Напоминание сохранено.")
     return ConversationHandler.END
 
 
+async def _retry_reminder(payload: ReminderPayload, job_name: str, exc: TelegramError) -> None:
+    attempts = payload.attempts + 1
+    if not payload.reminder_id or attempts >= REMINDER_MAX_ATTEMPTS:
+        logger.warning("Напоминание %s не доставлено после %d попыток: %s", payload.reminder_id, attempts, exc)
+        return
+    delay = REMINDER_RETRY_DELAY * 2 ** payload.attempts
+    if isinstance(exc, RetryAfter):
+        delay = max(delay, timedelta(seconds=exc.retry_after))
+    await database.add_reminder(
+        user_id=payload.user_id or "unknown",
+        chat_id=payload.chat_id,
+        remind_at=(datetime.now() + delay).isoformat(),
+        message=payload.message,
+        job_name=job_name,
+        plan_id=payload.plan_id,
+        dish_id=payload.dish_id,
+        attempts=attempts,
+    )
+
+
 async def send_reminder_job(context: ContextTypes.DEFAULT_TYPE) -> None:
-    job_data = context.job.data or {}
-    message = job_data.get("message", "Напоминание")
-    chat_id = job_data.get("chat_id")
-    reminder_id = job_data.get("reminder_id")
-    if chat_id is None:
+    payload: Optional[ReminderPayload] = context.job.data
+    if payload is None or payload.chat_id is None:
+        return
+    if payload.reminder_id and not await database.claim_reminder(payload.reminder_id):
         return
-    await context.bot.send_message(chat_id=chat_id, text=message)
-    if reminder_id:
-        await database.remove_reminder(reminder_id)
-    await database.log_action(job_data.get("user_id", "unknown"), job_data.get("dish_id"), "reminder_sent", {"message": message})
+    try:
+        await context.bot.send_message(chat_id=payload.chat_id, text=payload.message)
+    except (BadRequest, Forbidden) as exc:
+        logger.warning("Напоминание %s не доставлено и удалено: %s", payload.reminder_id, exc)
+        return
+    except TelegramError as exc:
+        await _retry_reminder(payload, context.job.name, exc)
+        return
+    finally:
+        context.bot_data.get("scheduled_reminders", set()).discard(payload.reminder_id)
+    database.queue_action(payload.user_id or "unknown", payload.dish_id, "reminder_sent", {"message": payload.message})
 
 
 async def import_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -757,18 +891,16 @@ async def import_receive_file(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("Пожалуйста, отправьте файл с расширением .csv.")
         return IMPORT_WAITING_FILE
     file = await document.get_file()
-    content = await file.download_as_bytearray()
-    try:
-        text = content.decode("utf-8")
-    except UnicodeDecodeError:
-        text = content.decode("utf-8", errors="ignore")
-    reader = csv.DictReader(io.StringIO(text))
-    result = await database.import_dishes(reader)
+    buffer = io.BytesIO()
+    await file.download_to_memory(buffer)
+    buffer.seek(0)
+    stream = io.TextIOWrapper(buffer, encoding="utf-8-sig", errors="ignore", newline="")
+    result = await database.import_dishes(csv.DictReader(stream))
     skipped = ", ".join(result["skipped"]) if result["skipped"] else "нет"
     await update.message.reply_text(
         f"Импорт завершён. Добавлено блюд: {result['added']}. Пропущены: {skipped}."
     )
-    await database.log_action(str(update.effective_user.id), None, "imported", result)
+    database.queue_action(str(update.effective_user.id), None, "imported", result)
     return ConversationHandler.END
 
 
@@ -779,8 +911,8 @@ async def find_by_ingredients_start(update: Update, context: ContextTypes.DEFAUL
     return FIND_BY_INGREDIENTS_INPUT
 
 
-async def find_by_ingredients_process(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text.strip()
+@require_nonempty_text()
+async def find_by_ingredients_process(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> int:
     ingredients = [item.strip() for item in text.replace("\n", ",").split(",") if item.strip()]
     results = await database.get_dish_suggestions_by_ingredients(ingredients)
     await update.message.reply_text(format_search_results(results), reply_markup=ReplyKeyboardRemove())
@@ -790,7 +922,7 @@ async def find_by_ingredients_process(update: Update, context: ContextTypes.DEFA
 async def scale_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    dish_id = int(query.data.split(":", 1)[1])
+    dish_id = int(context.matches[0].group(1))
     dish = await database.get_dish_by_id(dish_id)
     if not dish:
         await query.edit_message_text("Не удалось найти блюдо для масштабирования.")
@@ -813,119 +945,137 @@ async def scale_receive(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         context.user_data["scale"] = dish
         await update.message.reply_text("Введите положительное число порций.")
         return SCALE_WAITING
-    await update.message.reply_text(format_scaled_ingredients(dish, servings))
+    await update.message.reply_text(await _format_dish(format_scaled_ingredients, dish, servings))
     return ConversationHandler.END
 
 
+TEXT_INPUT = filters.TEXT & ~filters.COMMAND
+
 add_dish_handler = ConversationHandler(
     entry_points=[
-        MessageHandler(filters.Regex("^(Добавить блюдо)$"), add_dish_entry),
+        MessageHandler(filters.Text(("Добавить блюдо",)), add_dish_entry),
         CommandHandler("add_dish", add_dish_entry),
     ],
     states={
-        ADD_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_name)],
-        ADD_CATEGORY: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_category)],
-        ADD_CUISINE: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_cuisine)],
-        ADD_SERVINGS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_servings)],
-        ADD_PREP_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_prep_time)],
-        ADD_COOK_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_cook_time)],
-        ADD_DIFFICULTY: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_difficulty)],
-        ADD_DESCRIPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_description)],
-        ADD_INGREDIENTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_ingredients)],
-        ADD_INSTRUCTIONS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_instructions)],
-        ADD_TAGS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_dish_tags)],
+        ADD_NAME: [MessageHandler(TEXT_INPUT, add_dish_name)],
+        ADD_CATEGORY: [MessageHandler(TEXT_INPUT, add_dish_category)],
+        ADD_CUISINE: [MessageHandler(TEXT_INPUT, add_dish_cuisine)],
+        ADD_SERVINGS: [MessageHandler(TEXT_INPUT, add_dish_servings)],
+        ADD_PREP_TIME: [MessageHandler(TEXT_INPUT, add_dish_prep_time)],
+        ADD_COOK_TIME: [MessageHandler(TEXT_INPUT, add_dish_cook_time)],
+        ADD_DIFFICULTY: [MessageHandler(TEXT_INPUT, add_dish_difficulty)],
+        ADD_DESCRIPTION: [MessageHandler(TEXT_INPUT, add_dish_description)],
+        ADD_INGREDIENTS: [MessageHandler(TEXT_INPUT, add_dish_ingredients)],
+        ADD_INSTRUCTIONS: [MessageHandler(TEXT_INPUT, add_dish_instructions)],
+        ADD_TAGS: [MessageHandler(TEXT_INPUT, add_dish_tags)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
     allow_reentry=True,
+    name="add_dish",
+    persistent=PERSIST_CONVERSATIONS,
 )
 
 add_details_handler = ConversationHandler(
     entry_points=[
-        MessageHandler(filters.Regex("^(Добавить детали)$"), add_details_entry),
+        MessageHandler(filters.Text(("Добавить детали",)), add_details_entry),
         CommandHandler("add_details", add_details_entry),
     ],
     states={
-        DETAILS_SELECT: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_details_select)],
-        DETAILS_INGREDIENTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_details_ingredients)],
-        DETAILS_INSTRUCTIONS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_details_instructions)],
-        DETAILS_TAGS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_details_tags)],
+        DETAILS_SELECT: [MessageHandler(TEXT_INPUT, add_details_select)],
+        DETAILS_INGREDIENTS: [MessageHandler(TEXT_INPUT, add_details_ingredients)],
+        DETAILS_INSTRUCTIONS: [MessageHandler(TEXT_INPUT, add_details_instructions)],
+        DETAILS_TAGS: [MessageHandler(TEXT_INPUT, add_details_tags)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
     allow_reentry=True,
+    name="add_details",
+    persistent=PERSIST_CONVERSATIONS,
 )
 
 edit_dish_handler = ConversationHandler(
     entry_points=[
-        MessageHandler(filters.Regex("^(Изменить блюдо)$"), edit_dish_entry),
+        MessageHandler(filters.Text(("Изменить блюдо",)), edit_dish_entry),
         CommandHandler("edit_dish", edit_dish_entry),
     ],
     states={
-        EDIT_SELECT: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_select)],
-        EDIT_FIELD: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_field)],
-        EDIT_VALUE: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_value)],
+        EDIT_SELECT: [MessageHandler(TEXT_INPUT, edit_select)],
+        EDIT_FIELD: [MessageHandler(TEXT_INPUT, edit_field)],
+        EDIT_VALUE: [MessageHandler(TEXT_INPUT, edit_value)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
     allow_reentry=True,
+    name="edit_dish",
+    persistent=PERSIST_CONVERSATIONS,
 )
 
 delete_dish_handler = ConversationHandler(
     entry_points=[
-        MessageHandler(filters.Regex("^(Удалить блюдо)$"), delete_dish_entry),
+        MessageHandler(filters.Text(("Удалить блюдо",)), delete_dish_entry),
         CommandHandler("delete_dish", delete_dish_entry),
     ],
     states={
-        DELETE_SELECT: [MessageHandler(filters.TEXT & ~filters.COMMAND, delete_select)],
-        DELETE_CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, delete_confirm)],
+        DELETE_SELECT: [MessageHandler(TEXT_INPUT, delete_select)],
+        DELETE_CONFIRM: [MessageHandler(TEXT_INPUT, delete_confirm)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
     allow_reentry=True,
+    name="delete_dish",
+    persistent=PERSIST_CONVERSATIONS,
 )
 
 plan_handler = ConversationHandler(
     entry_points=[
         CommandHandler("plan", plan_start),
         CallbackQueryHandler(plan_start, pattern="^plan_create$"),
-        CallbackQueryHandler(plan_from_dish_callback, pattern="^plan_from_dish:"),
+        CallbackQueryHandler(plan_from_dish_callback, pattern=r"^plan_from_dish:(\d+)$"),
     ],
     states={
-        PLAN_CHOOSE_DISH: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_choose_dish)],
-        PLAN_SET_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_set_date)],
-        PLAN_SET_MEAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_set_meal)],
-        PLAN_SET_SERVINGS: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_set_servings)],
-        PLAN_SET_NOTES: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_set_notes)],
-        PLAN_CONFIRM_REMINDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_confirm_reminder)],
-        PLAN_SET_REMINDER_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, plan_set_reminder_time)],
+        PLAN_CHOOSE_DISH: [MessageHandler(TEXT_INPUT, plan_choose_dish)],
+        PLAN_SET_DATE: [MessageHandler(TEXT_INPUT, plan_set_date)],
+        PLAN_SET_MEAL: [MessageHandler(TEXT_INPUT, plan_set_meal)],
+        PLAN_SET_SERVINGS: [MessageHandler(TEXT_INPUT, plan_set_servings)],
+        PLAN_SET_NOTES: [MessageHandler(TEXT_INPUT, plan_set_notes)],
+        PLAN_CONFIRM_REMINDER: [MessageHandler(TEXT_INPUT, plan_confirm_reminder)],
+        PLAN_SET_REMINDER_TIME: [MessageHandler(TEXT_INPUT, plan_set_reminder_time)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
     allow_reentry=True,
+    name="plan",
+    persistent=PERSIST_CONVERSATIONS,
 )
 
 import_handler = ConversationHandler(
     entry_points=[
         CommandHandler("import", import_start),
-        MessageHandler(filters.Regex("^(Импорт)$"), import_start),
+        MessageHandler(filters.Text(("Импорт",)), import_start),
     ],
     states={
         IMPORT_WAITING_FILE: [MessageHandler(filters.Document.ALL, import_receive_file)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
+    name="import",
+    persistent=PERSIST_CONVERSATIONS,
 )
 
 find_by_ingredients_handler = ConversationHandler(
     entry_points=[
         CommandHandler("find", find_by_ingredients_start),
-        MessageHandler(filters.Regex("^(Поиск по ингредиентам)$"), find_by_ingredients_start),
+        MessageHandler(filters.Text(("Поиск по ингредиентам",)), find_by_ingredients_start),
     ],
     states={
-        FIND_BY_INGREDIENTS_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, find_by_ingredients_process)],
+        FIND_BY_INGREDIENTS_INPUT: [MessageHandler(TEXT_INPUT, find_by_ingredients_process)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
+    name="find_by_ingredients",
+    persistent=PERSIST_CONVERSATIONS,
 )
 
 scale_dish_handler = ConversationHandler(
-    entry_points=[CallbackQueryHandler(scale_start, pattern="^scale_dish:")],
+    entry_points=[CallbackQueryHandler(scale_start, pattern=r"^scale_dish:(\d+)$")],
     states={
-        SCALE_WAITING: [MessageHandler(filters.TEXT & ~filters.COMMAND, scale_receive)],
+        SCALE_WAITING: [MessageHandler(TEXT_INPUT, scale_receive)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
+    name="scale_dish",
+    persistent=PERSIST_CONVERSATIONS,
 )
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-from datetime import date, datetime, time, timedelta
+import math
+import re
+from datetime import date, time, timedelta
+from functools import lru_cache
 from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 MAIN_CATEGORIES = [
@@ -15,15 +18,24 @@ MAIN_CATEGORIES = [
 ]
 
 MEAL_TYPES = ["Завтрак", "Обед", "Ужин", "Перекус"]
+MEAL_ORDER = {meal: index for index, meal in enumerate(MEAL_TYPES)}
 DIFFICULTY_LEVELS = ["Легко", "Средне", "Сложно"]
 SKIP_KEYWORD = "Пропустить"
-FINISH_INGREDIENT_KEYWORDS = {"готово", "далее", "хватит", "стоп", "все", "всё"}
-YES_ANSWERS = {"да", "конечно", "ага", "yes", "y"}
-NO_ANSWERS = {"нет", "no", "неа"}
+FINISH_INGREDIENT_KEYWORDS = frozenset({"готово", "далее", "хватит", "стоп", "все", "всё"})
+YES_ANSWERS = frozenset({"да", "конечно", "ага", "yes", "y"})
+NO_ANSWERS = frozenset({"нет", "no", "неа"})
+_YES_NO_LOOKUP = {answer: True for answer in YES_ANSWERS}
+_YES_NO_LOOKUP.update({answer: False for answer in NO_ANSWERS})
+_YES_NO_LOOKUP.update({answer.capitalize(): value for answer, value in list(_YES_NO_LOOKUP.items())})
+FINISH_KEYWORD_MAX_LEN = max(map(len, FINISH_INGREDIENT_KEYWORDS))
+
+
+DECIMAL_TABLE = str.maketrans({",": ".", " ": None})
+INT_PATTERN = re.compile(r"[+-]?\d+")
 
 
 def normalize_decimal(text: str) -> str:
-    return text.replace(",", ".").replace(" ", "").strip()
+    return text.translate(DECIMAL_TABLE).strip()
 
 
 def parse_float(value: Any) -> Optional[float]:
@@ -33,49 +45,80 @@ def parse_float(value: Any) -> Optional[float]:
     if not text:
         return None
     try:
-        return float(text)
+        number = float(text)
     except ValueError:
         return None
+    return number if math.isfinite(number) else None
 
 
 def parse_int(value: Any) -> Optional[int]:
-    number = parse_float(value)
+    if value is None:
+        return None
+    text = normalize_decimal(str(value))
+    if INT_PATTERN.fullmatch(text):
+        return int(text)
+    number = parse_float(text)
     if number is None:
         return None
+    return int(round(number))
+
+
+TODAY_WORDS = frozenset({"сегодня", "today"})
+TOMORROW_WORDS = frozenset({"завтра", "tomorrow"})
+ISO_DATE_PATTERN = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+DOTTED_DATE_PATTERN = re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4}|\d{2})")
+TIME_PATTERN = re.compile(r"(\d{1,2})[:. ](\d{1,2})")
+
+
+def _safe_date(year: int, month: int, day: int) -> Optional[date]:
     try:
-        return int(round(number))
-    except (TypeError, ValueError):
+        return date(year, month, day)
+    except ValueError:
         return None
 
 
 def parse_date_input(text: str) -> Optional[date]:
     normalized = text.strip().lower()
-    today = date.today()
-    if normalized in {"сегодня", "today"}:
-        return today
-    if normalized in {"завтра", "tomorrow"}:
-        return today + timedelta(days=1)
+    if normalized in TODAY_WORDS:
+        return date.today()
+    if normalized in TOMORROW_WORDS:
+        return date.today() + timedelta(days=1)
+    match = ISO_DATE_PATTERN.fullmatch(normalized)
+    if match:
+        year, month, day = map(int, match.groups())
+        return _safe_date(year, month, day)
+    match = DOTTED_DATE_PATTERN.fullmatch(normalized)
+    if match:
+        day, month, year = map(int, match.groups())
+        if len(match.group(3)) == 2:
+            year += 2000 if year < 69 else 1900
+        return _safe_date(year, month, day)
     if normalized.startswith("через ") and normalized.endswith(" дней"):
-        number_part = normalized.replace("через", "").replace("дней", "").strip()
-        days = parse_int(number_part)
+        days = parse_int(normalized[len("через "):-len(" дней")].strip())
         if days is not None:
-            return today + timedelta(days=days)
-    for pattern in ("%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y"):
-        try:
-            return datetime.strptime(normalized, pattern).date()
-        except ValueError:
-            continue
+            return date.today() + timedelta(days=days)
     return None
 
 
 def parse_time_input(text: str) -> Optional[time]:
-    normalized = text.strip()
-    for pattern in ("%H:%M", "%H.%M", "%H %M"):
-        try:
-            return datetime.strptime(normalized, pattern).time()
-        except ValueError:
-            continue
-    return None
+    match = TIME_PATTERN.fullmatch(text.strip())
+    if not match:
+        return None
+    hour, minute = map(int, match.groups())
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+
+def parse_yes_no(text: str) -> Optional[bool]:
+    answer = _YES_NO_LOOKUP.get(text)
+    if answer is None:
+        answer = _YES_NO_LOOKUP.get(text.strip().lower())
+    return answer
+
+
+def is_finish_keyword(text: str) -> bool:
+    return len(text) <= FINISH_KEYWORD_MAX_LEN and text.lower() in FINISH_INGREDIENT_KEYWORDS
 
 
 def parse_ingredient_input(text: str) -> Dict[str, Any]:
@@ -95,28 +138,38 @@ def parse_ingredient_input(text: str) -> Dict[str, Any]:
 
 
 def compute_macros(ingredients: Sequence[Dict[str, Any]], ratio: float = 1.0) -> Dict[str, float]:
-    totals = {"calories": 0.0, "protein": 0.0, "fat": 0.0, "carbs": 0.0}
+    calories = protein = fat = carbs = 0.0
     for ingredient in ingredients:
-        for key in totals.keys():
-            value = ingredient.get(key)
-            if value is not None:
-                totals[key] += float(value) * ratio
-    return totals
-
-
-def format_macros(macros: Dict[str, float]) -> str:
-    meaningful = {key: value for key, value in macros.items() if value}
-    if not meaningful:
-        return ""
+        get = ingredient.get
+        value = get("calories")
+        if value is not None:
+            calories += value
+        value = get("protein")
+        if value is not None:
+            protein += value
+        value = get("fat")
+        if value is not None:
+            fat += value
+        value = get("carbs")
+        if value is not None:
+            carbs += value
+    return {"calories": calories * ratio, "protein": protein * ratio, "fat": fat * ratio, "carbs": carbs * ratio}
+
+
+MACRO_TEMPLATES = (
+    ("calories", "Ккал: {}"),
+    ("protein", "Б: {} г"),
+    ("fat", "Ж: {} г"),
+    ("carbs", "У: {} г"),
+)
+
+
+def format_macros(macros: Dict[str, Any]) -> str:
     parts = []
-    if macros.get("calories"):
-        parts.append(f"Ккал: {round(macros['calories'], 1)}")
-    if macros.get("protein"):
-        parts.append(f"Б: {round(macros['protein'], 1)} г")
-    if macros.get("fat"):
-        parts.append(f"Ж: {round(macros['fat'], 1)} г")
-    if macros.get("carbs"):
-        parts.append(f"У: {round(macros['carbs'], 1)} г")
+    for key, template in MACRO_TEMPLATES:
+        value = macros.get(key)
+        if value:
+            parts.append(template.format(round(value, 1)))
     return ", ".join(parts)
 
 
@@ -141,72 +194,88 @@ def format_duration(prep: Optional[int], cook: Optional[int]) -> Optional[str]:
     return prep_text or cook_text
 
 
+def format_quantity(quantity: Any) -> str:
+    return f"{float(quantity):.2f}".rstrip("0").rstrip(".")
+
+
+def format_amount(quantity: Any, unit: Optional[str]) -> str:
+    if quantity is not None:
+        return f" — {format_quantity(quantity)} {unit or ''}".rstrip()
+    if unit:
+        return f" — {unit}"
+    return ""
+
+
 def format_ingredients_list(ingredients: Sequence[Dict[str, Any]]) -> str:
     lines = []
     for ingredient in ingredients:
         name = ingredient.get("name")
         if not name:
             continue
-        quantity = ingredient.get("quantity")
-        unit = ingredient.get("unit") or ""
-        amount = ""
-        if quantity is not None:
-            number = round(float(quantity), 2)
-            number = int(number) if number.is_integer() else number
-            amount = f" — {number} {unit}".strip()
-        elif unit:
-            amount = f" — {unit}"
-        macros = format_macros({
-            key: ingredient.get(key)
-            for key in ("calories", "protein", "fat", "carbs")
-            if ingredient.get(key) is not None
-        })
+        amount = format_amount(ingredient.get("quantity"), ingredient.get("unit"))
+        macros = format_macros(ingredient)
         extra = f" ({macros})" if macros else ""
         lines.append(f"• {name}{amount}{extra}")
     return "\n".join(lines)
 
 
 def format_dish_card(dish: Dict[str, Any]) -> str:
-    parts = [f"🍽 {dish.get('name', 'Без названия')}"]
-    meta_lines = []
-    if dish.get("category"):
-        meta_lines.append(f"Категория: {dish['category']}")
-    if dish.get("cuisine"):
-        meta_lines.append(f"Кухня: {dish['cuisine']}")
-    if dish.get("servings"):
-        meta_lines.append(f"Порций: {dish['servings']}")
-    duration = format_duration(dish.get("prep_time"), dish.get("cook_time"))
+    get = dish.get
+    lines = [f"🍽 {get('name', 'Без названия')}", ""]
+    add = lines.append
+    if get("category"):
+        add(f"Категория: {dish['category']}")
+    if get("cuisine"):
+        add(f"Кухня: {dish['cuisine']}")
+    if get("servings"):
+        add(f"Порций: {dish['servings']}")
+    duration = format_duration(get("prep_time"), get("cook_time"))
     if duration:
-        meta_lines.append(duration)
-    if dish.get("difficulty"):
-        meta_lines.append(f"Сложность: {dish['difficulty']}")
-    if meta_lines:
-        parts.append("\n".join(meta_lines))
-    tags = dish.get("tags") or []
+        add(duration)
+    if get("difficulty"):
+        add(f"Сложность: {dish['difficulty']}")
+    if lines[-1]:
+        add("")
+    tags = get("tags")
     if tags:
-        parts.append("Теги: " + ", ".join(sorted(tags)))
-    if dish.get("description"):
-        parts.append(dish["description"])
-    ingredients_text = format_ingredients_list(dish.get("ingredients_list", []))
+        add("Теги: " + ", ".join(tags))
+        add("")
+    if get("description"):
+        add(dish["description"])
+        add("")
+    ingredients = get("ingredients_list") or []
+    ingredients_text = format_ingredients_list(ingredients)
     if ingredients_text:
-        parts.append("Ингредиенты:\n" + ingredients_text)
-        macros = compute_macros(dish.get("ingredients_list", []))
-        macros_line = format_macros(macros)
+        add("Ингредиенты:")
+        add(ingredients_text)
+        add("")
+        macros_line = format_macros(compute_macros(ingredients))
         if macros_line:
-            parts.append(f"Пищевая ценность на {dish.get('servings', 1)} порц.: {macros_line}")
-    instructions = dish.get("instructions") or dish.get("recipe")
+            add(f"Пищевая ценность на {get('servings', 1)} порц.: {macros_line}")
+            add("")
+    instructions = get("instructions") or get("recipe")
     if instructions:
-        parts.append("Рецепт:\n" + instructions)
-    if dish.get("notes"):
-        parts.append("Заметки:\n" + dish["notes"])
-    return "\n\n".join(parts)
+        add("Рецепт:")
+        add(instructions)
+        add("")
+    if get("notes"):
+        add("Заметки:")
+        add(dish["notes"])
+        add("")
+    lines.pop()
+    return "\n".join(lines)
+
+
+TAG_SEPARATORS = re.compile(r"[,\n#]")
+
+
+@lru_cache(maxsize=1024)
+def _split_tags(text: str) -> Tuple[str, ...]:
+    return tuple(tag for tag in (part.strip() for part in TAG_SEPARATORS.split(text)) if tag)
 
 
 def parse_tags(text: str) -> List[str]:
-    separators = {",", "\n", "#"}
-    for separator in separators:
-        text = text.replace(separator, ",")
-    return [tag.strip() for tag in text.split(",") if tag.strip()]
+    return list(_split_tags(text))
 
 
 def build_main_keyboard_layout(summary: Dict[str, Any]) -> List[List[str]]:
@@ -230,7 +299,7 @@ def group_plans_by_date(plans: Sequence[Dict[str, Any]]) -> Dict[str, List[Dict[
     for plan in plans:
         grouped.setdefault(plan.get("plan_date"), []).append(plan)
     for items in grouped.values():
-        items.sort(key=lambda item: MEAL_TYPES.index(item.get("meal_type")) if item.get("meal_type") in MEAL_TYPES else 99)
+        items.sort(key=lambda item: MEAL_ORDER.get(item.get("meal_type"), 99))
     return dict(sorted(grouped.items()))
 
 
@@ -242,10 +311,13 @@ def format_plan_entries(plans: Sequence[Dict[str, Any]]) -> str:
     for plan_date, entries in grouped.items():
         lines.append(f"📅 {plan_date}")
         for entry in entries:
-            servings = entry.get("servings")
+            get = entry.get
+            servings = get("servings")
+            notes = get("notes")
+            name = get("name") or get("dish_name") or ""
             servings_text = f" × {servings}" if servings else ""
-            note = f" — {entry['notes']}" if entry.get("notes") else ""
-            lines.append(f"  • {entry.get('meal_type', '')}: {entry.get('name', entry.get('dish_name', ''))}{servings_text}{note}")
+            note = f" — {notes}" if notes else ""
+            lines.append(f"  • {get('meal_type') or ''}: {name}{servings_text}{note}")
     return "\n".join(lines)
 
 
@@ -255,20 +327,8 @@ def format_shopping_items(items: Sequence[Dict[str, Any]]) -> str:
     lines = ["🛒 Список покупок:"]
     for item in items:
         name = item.get("name", "")
-        quantity = item.get("quantity")
-        unit = item.get("unit") or ""
-        amount = ""
-        if quantity is not None:
-            number = round(float(quantity), 2)
-            number = int(number) if number.is_integer() else number
-            amount = f" — {number} {unit}".strip()
-        elif unit:
-            amount = f" — {unit}"
-        macros = format_macros({
-            key: item.get(key)
-            for key in ("calories", "protein", "fat", "carbs")
-            if item.get(key)
-        })
+        amount = format_amount(item.get("quantity"), item.get("unit"))
+        macros = format_macros(item)
         extra = f" ({macros})" if macros else ""
         lines.append(f"• {name}{amount}{extra}")
     return "\n".join(lines)
@@ -324,6 +384,9 @@ def format_statistics(stats: Dict[str, Any], actions: Sequence[Dict[str, Any]])
     return "\n".join(lines)
 
 
+SCALED_KEYS = ("quantity", "calories", "protein", "fat", "carbs")
+
+
 def scale_ingredients(
     ingredients: Sequence[Dict[str, Any]],
     base_servings: float,
@@ -336,11 +399,10 @@ def scale_ingredients(
     scaled: List[Dict[str, Any]] = []
     for ingredient in ingredients:
         scaled_item = dict(ingredient)
-        if ingredient.get("quantity") is not None:
-            scaled_item["quantity"] = (ingredient["quantity"] or 0) * ratio
-        for key in ("calories", "protein", "fat", "carbs"):
-            if ingredient.get(key) is not None:
-                scaled_item[key] = (ingredient[key] or 0) * ratio
+        for key in SCALED_KEYS:
+            value = scaled_item.get(key)
+            if value is not None:
+                scaled_item[key] = value * ratio
         scaled.append(scaled_item)
     return scaled
 